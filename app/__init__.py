@@ -1,54 +1,49 @@
-from flask import Flask
+from flask import Flask, g
 from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager
+from flask_login import LoginManager, current_user
 from flask_socketio import SocketIO
 from flask_moment import Moment
 from .config import Config
 from zoneinfo import ZoneInfo
-import json
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 socketio = SocketIO()
 moment = Moment()
 
+# Built once: the filter runs for every timestamp of every rendered page
+guatemala_tz = ZoneInfo("America/Guatemala")
+utc_tz = ZoneInfo("UTC")
+
 def format_datetime_local(dt_utc, format="%d/%m/%Y %H:%M"):
     if dt_utc is None:
         return ""
-    guatemala_tz = ZoneInfo("America/Guatemala")
-    dt_local = dt_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(guatemala_tz)
+    dt_local = dt_utc.replace(tzinfo=utc_tz).astimezone(guatemala_tz)
     return dt_local.strftime(format)
 
-def parse_extras_filter(extras_json):
-    """Jinja filter to parse a JSON string of extras and return a readable string with quantities."""
-    if not extras_json:
-        return ""
-    try:
-        extras_list = json.loads(extras_json)
-        if not isinstance(extras_list, list) or not extras_list:
-            return ""
-        
-        parts = []
-        for extra in extras_list:
-            if isinstance(extra, dict) and 'name' in extra and 'quantity' in extra:
-                parts.append(f"{extra['name']} (x{extra['quantity']})")
-        
-        return ', '.join(parts)
-    except (json.JSONDecodeError, TypeError):
-        return extras_json
-
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # Register custom Jinja filters
     app.jinja_env.filters['datetime_local'] = format_datetime_local
-    app.jinja_env.filters['parse_extras'] = parse_extras_filter
+
+    # Cooperative psycopg2 under eventlet, before any connection is opened
+    from app.services.green_db import enable_green_psycopg2
+    enable_green_psycopg2(app)
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
-    socketio.init_app(app, cors_allowed_origins=app.config['CORS_ALLOWED_ORIGINS'], ping_timeout=20, ping_interval=10)
+    # eventlet only in the patched server processes. Left to auto-detect,
+    # Flask-SocketIO imports eventlet (a few hundred ms) in every process,
+    # CLI commands included.
+    from app.services.green import monkey_patched
+    socketio.init_app(app,
+                      async_mode='eventlet' if monkey_patched('socket') else 'threading',
+                      cors_allowed_origins=app.config['CORS_ALLOWED_ORIGINS'],
+                      message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+                      ping_timeout=20, ping_interval=10)
     moment.init_app(app)
     
     login_manager.login_view = 'auth.login'
@@ -57,11 +52,13 @@ def create_app():
     
     # Import models
     from app.models import User
+    from app.services.identity_service import load_identity
     
-    # User loader for Flask-Login
+    # User loader for Flask-Login: cached identity, no query per request or
+    # Socket.IO handshake
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_identity(int(user_id))
     
     # Register blueprints
     from app.routes.auth_routes import auth_bp
@@ -77,27 +74,36 @@ def create_app():
     # Register socket events
     from app.sockets.order_events import register_socket_events
     register_socket_events(socketio)
-    
-    # Create tables and default admin user
-    with app.app_context():
-        db.create_all()
-        create_default_admin(app)
-    
-    return app
 
-def create_default_admin(app):
-    from app.models import User
-    from werkzeug.security import generate_password_hash
+    # Socket sequence each rendered page starts from, so a reconnect can
+    # replay what was emitted since (see app/sockets/room_events.py)
+    from app.sockets.room_events import sync_state, room_for_role
+    @app.context_processor
+    def inject_socket_sync():
+        # Live boards take it before querying their orders (capture_sync_state)
+        if 'socket_sync' in g:
+            return {'socket_sync': g.socket_sync}
+        room = room_for_role(current_user.role) if current_user.is_authenticated else None
+        return {'socket_sync': sync_state(room) if room else None}
+
+    # Per-request SQL statement count (X-Query-Count header when enabled)
+    from app.services.query_counter import register_query_counter
+    register_query_counter(app)
+
+    # Per-endpoint latency and SQL metrics, served at /admin/metrics
+    from app.services.metrics_service import register_metrics
+    register_metrics(app)
+
+    # CLI commands (flask rebuild-sales-rollups)
+    from app.commands import register_commands
+    register_commands(app)
+
+    # Broadcast stock changes only after their transaction commits
+    from app.services.stock_service import register_stock_broadcasts
+    register_stock_broadcasts()
+
+    # Publish order status events only after their transaction commits
+    from app.services.order_lifecycle_service import register_order_events
+    register_order_events()
     
-    # Check if admin exists
-    admin = User.query.filter_by(username=app.config['DEFAULT_ADMIN_USERNAME']).first()
-    if not admin:
-        admin_user = User(
-            username=app.config['DEFAULT_ADMIN_USERNAME'],
-            password_hash=generate_password_hash(app.config['DEFAULT_ADMIN_PASSWORD']),
-            role='admin',
-            full_name='Administrador'
-        )
-        db.session.add(admin_user)
-        db.session.commit()
-        print(f"Default admin user created: {app.config['DEFAULT_ADMIN_USERNAME']}/{app.config['DEFAULT_ADMIN_PASSWORD']}")
+    return app
@@ -0,0 +1,63 @@
+import click
+from flask import current_app
+from sqlalchemy.schema import CreateIndex
+from app import db
+
+
+def create_missing_indexes():
+    """db.create_all() only creates indexes along with new tables; add the ones
+    declared later on tables that already exist."""
+    # IF NOT EXISTS rather than checkfirst: reflection skips expression indexes
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def create_default_admin():
+    """Creates the default admin user unless it exists; returns whether it did."""
+    from app.models import User
+
+    username = current_app.config['DEFAULT_ADMIN_USERNAME']
+    if User.query.filter_by(username=username).first():
+        return False
+    admin_user = User(username=username, role='admin', full_name='Administrador')
+    admin_user.set_password(current_app.config['DEFAULT_ADMIN_PASSWORD'])
+    db.session.add(admin_user)
+    db.session.commit()
+    return True
+
+
+def init_db():
+    """
+    Creates missing tables and indexes and the default admin. Idempotent, so
+    it can run on every deploy; it is kept out of create_app() so booting a
+    worker does not pay for it.
+    """
+    db.create_all()
+    create_missing_indexes()
+    return create_default_admin()
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables and indexes and the default admin user."""
+        if init_db():
+            click.echo(f"Usuario administrador creado: {current_app.config['DEFAULT_ADMIN_USERNAME']}")
+        click.echo("Base de datos lista.")
+
+    @app.cli.command('rebuild-sales-rollups')
+    def rebuild_sales_rollups_command():
+        """Regenerate the sales rollup tables from order history."""
+        from app.services.sales_rollup_service import rebuild_sales_rollups
+        replayed = rebuild_sales_rollups()
+        db.session.commit()
+        click.echo(f"Rollups de ventas regenerados a partir de {replayed} órdenes.")
+
+    @app.cli.command('backfill-order-item-extras')
+    def backfill_order_item_extras_command():
+        """Copy order-line extras stored as JSON text into order_item_extra."""
+        from app.services.order_service import backfill_order_item_extras
+        migrated, skipped = backfill_order_item_extras()
+        click.echo(f"Extras migrados de {migrated} líneas de orden ({skipped} extras no se pudieron migrar).")
@@ -1,11 +1,33 @@
 
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'una-clave-muy-secreta')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
+
+    # Bajo eventlet, las consultas a PostgreSQL ceden el hub mientras esperan
+    # la respuesta en lugar de bloquear todo el worker
+    DB_GREEN = os.environ.get('DB_GREEN', 'true').lower() == 'true'
+    # Pool de conexiones por worker (PostgreSQL). Con DB_GREEN muchas
+    # peticiones esperan a la vez, así que DB_POOL_TIMEOUT es lo que espera
+    # una petición por una conexión libre antes de fallar.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # Tiempo máximo de cada sentencia SQL en milisegundos (0 = sin límite)
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+        'connect_args': {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'},
+    } if (SQLALCHEMY_DATABASE_URI or '').startswith('postgres') else {}
+
     # Credenciales del usuario administrador por defecto
     DEFAULT_ADMIN_USERNAME = os.environ.get('DEFAULT_ADMIN_USERNAME', 'admin')
     DEFAULT_ADMIN_PASSWORD = os.environ.get('DEFAULT_ADMIN_PASSWORD')
@@ -13,4 +35,38 @@ class Config:
     # Configuracion de CORS
     _origins_str = os.environ.get('CORS_ALLOWED_ORIGINS', 'http://localhost:5000,http://127.0.0.1:5000,https://m-s-system.onrender.com')
     CORS_ALLOWED_ORIGINS = [origin.strip() for origin in _origins_str.split(',')]
+    
+    # Cola de mensajes de Socket.IO (ej. redis://redis:6379/0). Es necesaria para
+    # correr más de un worker: los eventos emitidos por un proceso se reenvían a
+    # los clientes conectados a los demás. Sin ella solo se soporta un worker.
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    # Con varios workers los clientes deben usar solo WebSocket: el transporte
+    # long-polling necesita sesiones "sticky" que gunicorn no puede garantizar.
+    SOCKETIO_WEBSOCKET_ONLY = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'true' if SOCKETIO_MESSAGE_QUEUE else 'false').lower() == 'true'
+    # Eventos que se guardan por sala para reenviarlos a clientes que se reconectan
+    SOCKETIO_REPLAY_BUFFER_SIZE = int(os.environ.get('SOCKETIO_REPLAY_BUFFER_SIZE', 200))
+    
+    # Devuelve en la cabecera X-Query-Count cuántas consultas SQL hizo cada
+    # petición (útil en desarrollo y en benchmarks para detectar N+1)
+    SQL_QUERY_COUNT_HEADER = os.environ.get('SQL_QUERY_COUNT_HEADER', 'false').lower() == 'true'
+
+    # Métricas de latencia por endpoint, SQL por petición y Socket.IO en
+    # formato Prometheus (/admin/metrics, solo administradores)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+    # Procesos que generan los PDF fuera de la petición (0 = generarlos en la
+    # misma petición) y carpeta donde se guardan los PDF ya generados
+    PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 1))
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'ms_pdf_cache')
+    # Segundos que una petición espera un PDF; un proceso que no responde
+    # en ese tiempo se reemplaza
+    PDF_RENDER_TIMEOUT = int(os.environ.get('PDF_RENDER_TIMEOUT', 60))
+
+    # Iteraciones PBKDF2 de los hashes de contraseña. Los hashes hechos con
+    # otro valor se regeneran cuando el usuario inicia sesión.
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))
 
+    # Segundos que cada worker guarda en memoria la identidad (rol, nombre,
+    # activo) del usuario con sesión, para no consultarla en cada petición.
+    # Es también lo que tarda un cambio del usuario en verse en los demás workers.
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 5))
@@ -1,16 +1,18 @@
 from app import db
+from app.services.password_service import hash_password, verify_password
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.sql import func
 from sqlalchemy import and_
 from sqlalchemy.orm import remote
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
 # Association table for the combo recipes
 class ComboItem(db.Model):
     __tablename__ = 'combo_item'
     id = db.Column(db.Integer, primary_key=True)
-    combo_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    combo_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
     component_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     component = db.relationship('Product', foreign_keys=[component_product_id])
@@ -25,10 +27,10 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -40,13 +42,20 @@ class Product(db.Model):
     is_active = db.Column(db.Boolean, default=True)
 
     components = db.relationship('ComboItem', foreign_keys=[ComboItem.combo_product_id], lazy='dynamic', cascade="all, delete-orphan")
-    parent_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=True, index=True)
     variants = db.relationship('Product', 
                                backref=db.backref('parent', remote_side=[id]), 
                                lazy='dynamic', 
                                primaryjoin=and_(remote(parent_id) == id, remote(is_active) == True))
     stock_consumption = db.Column(db.Integer, nullable=False, default=1)
 
+    __table_args__ = (
+        # Active base products: menu, stock and low-stock listings
+        db.Index('ix_product_active_base', 'category', 'name',
+                 postgresql_where=db.text('parent_id IS NULL AND is_active = true'),
+                 sqlite_where=db.text('parent_id IS NULL AND is_active = 1')),
+    )
+
     @property
     def is_base_product(self):
         return self.parent_id is None
@@ -80,6 +89,28 @@ class Product(db.Model):
             ]
         return data
 
+class clock_now(FunctionElement):
+    """
+    Time at which the statement runs. now() on Postgres is the start of the
+    transaction, so a change committed later could carry an instant older
+    than one a board client already saw through ?since=.
+    """
+    type = db.DateTime(timezone=True)
+    inherit_cache = True
+
+@compiles(clock_now)
+def _compile_clock_now(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+@compiles(clock_now, 'postgresql')
+def _compile_clock_now_postgresql(element, compiler, **kw):
+    return 'clock_timestamp()'
+
+@compiles(clock_now, 'sqlite')
+def _compile_clock_now_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP has whole seconds on SQLite
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100))
@@ -87,13 +118,19 @@ class Order(db.Model):
     status = db.Column(db.String(20), default='pending')
     total = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
-    updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), onupdate=clock_now())
     waiter_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     cash_received = db.Column(db.Float)
     change_given = db.Column(db.Float)
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     waiter = db.relationship('User', backref='orders')
 
+    __table_args__ = (
+        # Dashboards, boards and reports filter by status and a created_at range
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_waiter_status_created_at', 'waiter_id', 'status', 'created_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -108,15 +145,28 @@ class Order(db.Model):
             'items': [item.to_dict() for item in self.items]
         }
 
+# Last change of an order, used by the board endpoints' since= filter
+db.Index('ix_order_changed_at', func.coalesce(Order.updated_at, Order.created_at))
+db.Index('ix_order_waiter_changed_at', Order.waiter_id, func.coalesce(Order.updated_at, Order.created_at))
+
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     unit_price = db.Column(db.Float, nullable=False)
-    extras = db.Column(db.Text)
+    # JSON text the extras were stored as before order_item_extra; only read
+    # by the backfill-order-item-extras command
+    legacy_extras = db.Column('extras', db.Text)
     notes = db.Column(db.Text)
     product = db.relationship('Product', backref='order_items')
+    extras = db.relationship('OrderItemExtra', backref='order_item', lazy=True,
+                             cascade='all, delete-orphan', order_by='OrderItemExtra.id')
+
+    @property
+    def extras_label(self):
+        """Readable extras, e.g. 'Queso (x1), Tocino (x2)'."""
+        return ', '.join(f"{extra.product.name} (x{extra.quantity})" for extra in self.extras)
 
     def to_dict(self):
         return {
@@ -125,10 +175,28 @@ class OrderItem(db.Model):
             'product_name': self.product.name if self.product else None,
             'quantity': self.quantity,
             'unit_price': self.unit_price,
-            'extras': self.extras,
+            'extras': [extra.to_dict() for extra in self.extras],
             'notes': self.notes
         }
 
+class OrderItemExtra(db.Model):
+    # Extras added to one order line, per unit of the line: a line of 2 with
+    # quantity 1 of an extra consumes 2 of it
+    id = db.Column(db.Integer, primary_key=True)
+    order_item_id = db.Column(db.Integer, db.ForeignKey('order_item.id'), nullable=False, index=True)
+    extra_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)
+    product = db.relationship('Product')
+
+    def to_dict(self):
+        return {
+            'product_id': self.extra_product_id,
+            'name': self.product.name if self.product else None,
+            'quantity': self.quantity,
+            'unit_price': self.unit_price
+        }
+
 class DailyReport(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True)
@@ -136,3 +204,36 @@ class DailyReport(db.Model):
     cash_in_register = db.Column(db.Float)
     difference = db.Column(db.Float)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now())
+
+class CatalogVersion(db.Model):
+    # Single row bumped by every admin menu change; lets each process know when
+    # its cached copy of the catalog is stale.
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Sales rollups. Kept up to date in the same transaction that pays or cancels
+# an order (see sales_rollup_service) and keyed by the Guatemala-local day of
+# the order, so reports never have to rescan order history.
+class SalesDaily(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SalesHourly(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)  # 0-23, Guatemala time
+    total_sales = db.Column(db.Float, nullable=False, default=0.0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SalesProductDaily(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    # Base product: variants count against their parent, weighted by stock_consumption
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class SalesExtraDaily(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    # Extra product as sold (not expanded to its base product)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
@@ -1,13 +1,18 @@
-from flask import Blueprint, make_response, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Response, abort, current_app, make_response, render_template, request, redirect, url_for, flash, stream_with_context
 from flask_login import login_required, current_user
-from app.models import User, Product, Order, OrderItem, DailyReport, ComboItem
-from app.services.report_service import generate_daily_report_pdf, generate_sales_report_pdf
-from app import db, socketio
+from app.models import User, Product, Order, DailyReport, ComboItem
+from app.services.report_service import report_period, sales_summary, daily_report_orders
+from app.services.pdf_service import render_pdf, cached_pdf
+from app.services.catalog_service import get_catalog, get_stock_levels, with_stock, bump_catalog_version
+from app.services.order_service import order_graph_options
+from app.services.sales_rollup_service import day_totals
+from app.services.export_service import order_line_rows, csv_chunks, ndjson_chunks
+from app.services.identity_service import invalidate_identity
+from app.services.metrics_service import render_metrics
+from app import db
 from datetime import datetime, date, timedelta, time
-from werkzeug.security import generate_password_hash
 import bleach
 from functools import wraps
-from sqlalchemy.orm import aliased
 from zoneinfo import ZoneInfo
 import logging
 
@@ -15,6 +20,7 @@ admin_bp = Blueprint('admin', __name__)
 
 # Define the timezone for Guatemala
 guatemala_tz = ZoneInfo('America/Guatemala')
+utc_tz = ZoneInfo('UTC')
 
 def get_current_gt_datetime():
     """Returns the current datetime in Guatemala timezone."""
@@ -29,8 +35,8 @@ def get_day_range_utc(start_date_local):
     end_of_day_local = datetime.combine(start_date_local, time.max, tzinfo=guatemala_tz)
     
     # Convert to UTC for database queries
-    start_of_day_utc = start_of_day_local.astimezone(ZoneInfo('UTC'))
-    end_of_day_utc = end_of_day_local.astimezone(ZoneInfo('UTC'))
+    start_of_day_utc = start_of_day_local.astimezone(utc_tz)
+    end_of_day_utc = end_of_day_local.astimezone(utc_tz)
     
     return start_of_day_utc, end_of_day_utc
 
@@ -48,17 +54,7 @@ def admin_required(f):
 @admin_required
 def dashboard():
     today_local = get_current_gt_datetime().date()
-    start_of_day_utc, end_of_day_utc = get_day_range_utc(today_local)
-
-    today_orders = Order.query.filter(
-        Order.created_at.between(start_of_day_utc, end_of_day_utc),
-        Order.status == 'paid'
-    ).count()
-    
-    today_sales = db.session.query(db.func.sum(Order.total)).filter(
-        Order.created_at.between(start_of_day_utc, end_of_day_utc),
-        Order.status == 'paid'
-    ).scalar() or 0
+    today_sales, today_orders = day_totals(today_local)
     
     low_stock_products = Product.query.filter(Product.parent_id.is_(None), Product.stock <= 5, Product.is_active == True).all()
     
@@ -71,9 +67,8 @@ def dashboard():
 @login_required
 @admin_required
 def menu():
-    products = Product.query.filter(Product.parent_id.is_(None), Product.is_active==True).order_by(Product.category, Product.name).all()
-    component_products_query = Product.query.filter(Product.category.in_(['Principal', 'Bebida']), Product.parent_id.is_(None), Product.is_active==True).order_by(Product.name).all()
-    component_products = [p.to_dict() for p in component_products_query]
+    products = with_stock(get_catalog()['products'], get_stock_levels())
+    component_products = sorted((p for p in products if p['category'] in ['Principal', 'Bebida']), key=lambda p: p['name'])
     return render_template('admin/menu.html', products=products, component_products=component_products)
 
 @admin_bp.route('/add_product', methods=['POST'])
@@ -133,6 +128,7 @@ def add_product():
             flash_message = 'Producto agregado exitosamente.'
             db.session.add(product)
 
+        bump_catalog_version()
         db.session.commit()
         flash(flash_message, 'success')
 
@@ -182,6 +178,7 @@ def edit_product(product_id):
             if product.category != 'Principal':
                 product.price = float(request.form.get('price', '0'))
 
+        bump_catalog_version()
         db.session.commit()
         flash('Producto actualizado exitosamente.', 'success')
 
@@ -219,6 +216,7 @@ def add_variant(parent_id):
             stock_consumption=stock_consumption
         )
         db.session.add(variant)
+        bump_catalog_version()
         db.session.commit()
         flash('Variante agregada exitosamente.', 'success')
     except ValueError:
@@ -249,6 +247,7 @@ def edit_variant(variant_id):
         variant.name = name
         variant.price = price
         variant.stock_consumption = stock_consumption
+        bump_catalog_version()
         db.session.commit()
         flash('Variante actualizada exitosamente.', 'success')
     except ValueError:
@@ -270,6 +269,7 @@ def delete_variant(variant_id):
         return redirect(url_for('admin.menu'))
     try:
         variant.is_active = False
+        bump_catalog_version()
         db.session.commit()
         flash('Variante eliminada exitosamente.', 'success')
     except Exception as e:
@@ -284,6 +284,7 @@ def delete_variant(variant_id):
 def delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     product.is_active = False
+    bump_catalog_version()
     db.session.commit()
     flash('Producto eliminado exitosamente.', 'success')
     return redirect(url_for('admin.menu'))
@@ -310,9 +311,11 @@ def add_user():
         flash('El nombre de usuario ya existe.', 'error')
         return redirect(url_for('admin.users'))
     try:
-        user = User(username=username, password_hash=generate_password_hash(password), role=role, full_name=full_name)
+        user = User(username=username, role=role, full_name=full_name)
+        user.set_password(password)
         db.session.add(user)
         db.session.commit()
+        invalidate_identity(user.id)
         flash('Usuario creado exitosamente.', 'success')
     except Exception as e:
         flash('Error al crear usuario.', 'error')
@@ -323,72 +326,41 @@ def add_user():
 @login_required
 @admin_required
 def reports():
-    logging.warning("--- ENTERING REPORTS ROUTE ---")
     period = request.args.get('period', 'monthly')
     today_local = get_current_gt_datetime().date()
-    logging.warning(f"[REPORTS] Today in GT Timezone: {today_local}")
-
-    if period == 'weekly':
-        start_date_local = today_local - timedelta(days=today_local.weekday())
-        end_date_local = start_date_local + timedelta(days=6)
-        period_label = f"Semana del {start_date_local.strftime('%d/%m')} al {end_date_local.strftime('%d/%m')}"
-    else:  # monthly
-        start_date_local = today_local.replace(day=1)
-        next_month = start_date_local.replace(day=28) + timedelta(days=4)
-        end_date_local = next_month - timedelta(days=next_month.day)
-        period_label = f"Mes de {start_date_local.strftime('%B de %Y')}"
+    start_date_local, end_date_local, period_label = report_period(period, today_local)
 
-    start_range_utc, end_range_utc = get_day_range_utc(start_date_local)[0], get_day_range_utc(end_date_local)[1]
-    logging.warning(f"[REPORTS] Querying for UTC range: {start_range_utc} to {end_range_utc}")
-
-    # --- Correctly query and build report_data ---
-    total_sales_query = db.session.query(db.func.sum(Order.total)).filter(Order.status == 'paid', Order.created_at.between(start_range_utc, end_range_utc)).scalar() or 0
-    total_orders_query = db.session.query(db.func.count(Order.id)).filter(Order.status == 'paid', Order.created_at.between(start_range_utc, end_range_utc)).scalar() or 0
-
-    OrderItemProduct = aliased(Product)
-    ParentProduct = aliased(Product)
-
-    top_product_query = db.session.query(
-        db.case(
-            (OrderItemProduct.parent_id.isnot(None), ParentProduct.name),
-            else_=OrderItemProduct.name
-        ).label('base_product_name'),
-        db.func.sum(OrderItem.quantity * OrderItemProduct.stock_consumption).label('total_quantity')
-    ).select_from(OrderItem) \
-    .join(Order, Order.id == OrderItem.order_id) \
-    .join(OrderItemProduct, OrderItem.product_id == OrderItemProduct.id) \
-    .outerjoin(ParentProduct, OrderItemProduct.parent_id == ParentProduct.id) \
-    .filter(Order.status == 'paid', Order.created_at.between(start_range_utc, end_range_utc)) \
-    .group_by('base_product_name') \
-    .order_by(db.desc('total_quantity')).first()
+    # --- All metrics come from one cached query over the sales rollups ---
+    summary = sales_summary(period, start_date_local, end_date_local, today_local)
 
     producto_mas_vendido_str = "N/A"
-    if top_product_query:
-        producto_mas_vendido_str = f"{top_product_query.base_product_name} (Vendidos: {int(top_product_query.total_quantity)})"
-
-    grouping_expression = db.func.date_trunc('day', Order.created_at.op('AT TIME ZONE')('America/Guatemala'))
-    top_day_query = db.session.query(
-        grouping_expression.label('sale_day'),
-        db.func.sum(Order.total).label('total_sales')
-    ).filter(
-        Order.status == 'paid',
-        Order.created_at.between(start_range_utc, end_range_utc)
-    ).group_by(grouping_expression).order_by(db.desc('total_sales')).first()
-    logging.warning(f"[REPORTS] Top day query result: {top_day_query}")
+    if summary['top_product']:
+        name, quantity = summary['top_product']
+        producto_mas_vendido_str = f"{name} (Vendidos: {quantity})"
+
+    extra_mas_vendido_str = "N/A"
+    if summary['top_extra']:
+        name, quantity = summary['top_extra']
+        extra_mas_vendido_str = f"{name} (Vendidos: {quantity})"
 
     dia_mas_ventas_str = "N/A"
-    if top_day_query and top_day_query.sale_day:
-        sale_day_local = top_day_query.sale_day # No timezone conversion needed
-        dia_mas_ventas_str = f"{sale_day_local.strftime('%A, %d de %B')} (Total: Q{top_day_query.total_sales:.2f})"
+    if summary['top_day']:
+        sale_day_local, day_sales = summary['top_day']
+        dia_mas_ventas_str = f"{sale_day_local.strftime('%A, %d de %B')} (Total: Q{day_sales:.2f})"
 
-    logging.warning(f"[REPORTS] Final 'dia_mas_ventas_str': {dia_mas_ventas_str}")
+    hora_mas_ventas_str = "N/A"
+    if summary['top_hour']:
+        hour, hour_sales = summary['top_hour']
+        hora_mas_ventas_str = f"{hour:02d}:00 - {hour:02d}:59 (Total: Q{hour_sales:.2f})"
 
     report_data = {
         'period_label': period_label,
-        'total_sales': total_sales_query,
-        'total_orders': total_orders_query,
+        'total_sales': summary['total_sales'],
+        'total_orders': summary['total_orders'],
         'producto_mas_vendido': producto_mas_vendido_str,
-        'dia_mas_ventas': dia_mas_ventas_str
+        'extra_mas_vendido': extra_mas_vendido_str,
+        'dia_mas_ventas': dia_mas_ventas_str,
+        'hora_mas_ventas': hora_mas_ventas_str
     }
 
     if request.args.get('download') == 'pdf':
@@ -399,10 +371,11 @@ def reports():
             'Total de Ventas': f"Q{report_data['total_sales']:.2f}",
             'Total de Órdenes': report_data['total_orders'],
             'Producto Más Vendido': report_data['producto_mas_vendido'],
-            'Día con Más Ventas': report_data['dia_mas_ventas']
+            'Extra Más Vendido': report_data['extra_mas_vendido'],
+            'Día con Más Ventas': report_data['dia_mas_ventas'],
+            'Hora con Más Ventas': report_data['hora_mas_ventas']
         }
-        pdf_buffer = generate_sales_report_pdf(pdf_report_data, period)
-        response = make_response(pdf_buffer.getvalue())
+        response = make_response(render_pdf('sales_report', pdf_report_data, period))
         response.headers['Content-Type'] = 'application/pdf'
         response.headers['Content-Disposition'] = 'inline; filename=reporte_ventas.pdf'
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -410,7 +383,47 @@ def reports():
         response.headers['Expires'] = '0'
         return response
 
-    return render_template('admin/reports.html', report_data=report_data, period=period)
+    return render_template('admin/reports.html', report_data=report_data, period=period, today=today_local)
+
+@admin_bp.route('/export/sales')
+@login_required
+@admin_required
+def export_sales():
+    """Order lines created between two local dates, streamed as CSV or NDJSON."""
+    try:
+        start_date_local = date.fromisoformat(request.args.get('start', ''))
+        end_date_local = date.fromisoformat(request.args.get('end', ''))
+    except ValueError:
+        flash('Rango de fechas inválido.', 'error')
+        return redirect(url_for('admin.reports'))
+    if end_date_local < start_date_local:
+        flash('La fecha final debe ser posterior a la inicial.', 'error')
+        return redirect(url_for('admin.reports'))
+
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+    start_range_utc, end_range_utc = get_day_range_utc(start_date_local)[0], get_day_range_utc(end_date_local)[1]
+    rows = order_line_rows(start_range_utc, end_range_utc, statuses)
+
+    if request.args.get('format') == 'ndjson':
+        chunks, mimetype, extension = ndjson_chunks(rows), 'application/x-ndjson', 'ndjson'
+    else:
+        chunks, mimetype, extension = csv_chunks(rows), 'text/csv; charset=utf-8', 'csv'
+
+    # Rows are read and sent while the client downloads; nothing is buffered
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=ventas_{start_date_local}_{end_date_local}.{extension}'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@admin_bp.route('/metrics')
+@login_required
+@admin_required
+def metrics():
+    """Request, SQL and Socket.IO metrics of this worker in the Prometheus text format."""
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 
@@ -434,10 +447,7 @@ def daily_close():
         cash_in_register = request.form.get('cash_in_register', 0)
         try:
             cash_in_register = float(cash_in_register)
-            total_sales = db.session.query(db.func.sum(Order.total)).filter(
-                Order.created_at.between(start_of_day_utc, end_of_day_utc),
-                Order.status == 'paid'
-            ).scalar() or 0
+            total_sales = day_totals(today_local)[0]
             logging.warning(f"[DAILY_CLOSE] Calculated total_sales in POST: {total_sales}")
             
             daily_report = DailyReport.query.filter_by(date=today_local).first()
@@ -460,11 +470,8 @@ def daily_close():
             db.session.rollback()
 
     # --- Logic for GET request ---
-    # Always calculate the current total sales from orders for display
-    total_sales = db.session.query(db.func.sum(Order.total)).filter(
-        Order.created_at.between(start_of_day_utc, end_of_day_utc),
-        Order.status == 'paid'
-    ).scalar() or 0
+    # Always read the current total sales for display
+    total_sales = day_totals(today_local)[0]
 
     # Fetch the existing daily report mainly for cash_in_register and difference
     daily_report = DailyReport.query.filter_by(date=today_local).first()
@@ -473,66 +480,52 @@ def daily_close():
     else:
         logging.warning(f"[DAILY_CLOSE] No daily_report found for {today_local}. Current calculated sales: {total_sales}")
 
-    # Fetch orders for display
-    orders = Order.query.filter(
-        Order.created_at.between(start_of_day_utc, end_of_day_utc),
-        Order.status.in_(['paid', 'cancelled'])
-    ).order_by(Order.created_at.desc()).all()
-    orders_data = [{'order': order.to_dict(), 'waiter_name': order.waiter.full_name if order.waiter else 'N/A'} for order in orders]
-
     if 'download' in request.args and request.args.get('download') == 'pdf':
         logging.warning("[DAILY_CLOSE] PDF download requested.")
-        
-        # Use today's date for the PDF if no report is closed yet
-        report_date_for_pdf = daily_report.date if daily_report else today_local
+
+        # Today's close unless an earlier day is asked for (?date=YYYY-MM-DD)
+        report_date_for_pdf = today_local
+        if request.args.get('date'):
+            try:
+                report_date_for_pdf = min(date.fromisoformat(request.args['date']), today_local)
+            except ValueError:
+                flash('Fecha inválida.', 'error')
+                return redirect(url_for('admin.daily_close'))
         logging.warning(f"[DAILY_CLOSE] PDF generation for date: {report_date_for_pdf}")
-        
-        start_pdf_utc, end_pdf_utc = get_day_range_utc(report_date_for_pdf)
-
-        pdf_orders = Order.query.filter(
-            Order.created_at.between(start_pdf_utc, end_pdf_utc),
-            Order.status.in_(['paid', 'cancelled'])
-        ).order_by(Order.created_at.asc()).all()
-
-        pdf_orders_data = []
-        for order in pdf_orders:
-            item_names = []
-            for item in order.items:
-                product_name = item.product.name
-                if item.product.parent:
-                    product_name = f"{item.product.parent.name} ({product_name})"
-                item_names.append(f"{item.quantity}x {product_name}")
-            
-            items_str = ", ".join(item_names)
-            order_local_time = order.created_at.astimezone(guatemala_tz)
-            pdf_orders_data.append({
-                'id': order.id,
-                'time': order_local_time.strftime('%H:%M:%S'),
-                'total': f"Q{order.total:.2f}",
-                'status': order.status,
-                'items': items_str
-            })
-        
-        # Use calculated total_sales for the PDF, not necessarily from a saved report
-        final_total_sales = db.session.query(db.func.sum(Order.total)).filter(
-            Order.created_at.between(start_pdf_utc, end_pdf_utc),
-            Order.status == 'paid'
-        ).scalar() or 0
-
-        context = {
-            'daily_report': daily_report, # Can be None
-            'total_sales': final_total_sales,
-            'report_date_str': report_date_for_pdf.strftime('%A, %d de %B de %Y'),
-            'orders_data': pdf_orders_data
-        }
-        
-        pdf_buffer = generate_daily_report_pdf(context)
-        response = make_response(pdf_buffer.getvalue())
+
+        # A day that ended before yesterday can no longer change (orders paid
+        # after midnight still count on their creation day): its PDF is
+        # rendered once and then served from the cache.
+        identity = report_date_for_pdf.isoformat() if report_date_for_pdf < today_local - timedelta(days=1) else None
+        pdf = cached_pdf('daily_report', identity) if identity else None
+
+        if pdf is None:
+            pdf_report = daily_report if report_date_for_pdf == today_local else DailyReport.query.filter_by(date=report_date_for_pdf).first()
+            start_pdf_utc, end_pdf_utc = get_day_range_utc(report_date_for_pdf)
+
+            context = {
+                'cash_in_register': pdf_report.cash_in_register if pdf_report else None,
+                'difference': pdf_report.difference if pdf_report else None,
+                # Calculated total sales, not necessarily the saved report's
+                'total_sales': day_totals(report_date_for_pdf)[0],
+                'report_date_str': report_date_for_pdf.strftime('%A, %d de %B de %Y'),
+                'orders_data': daily_report_orders(start_pdf_utc, end_pdf_utc)
+            }
+            pdf = render_pdf('daily_report', context, identity=identity)
+
+        response = make_response(pdf)
         response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = 'inline; filename=cierre_diario.pdf'
+        response.headers['Content-Disposition'] = f'inline; filename=cierre_diario_{report_date_for_pdf}.pdf'
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         return response
 
+    # Fetch orders for display
+    orders = Order.query.filter(
+        Order.created_at.between(start_of_day_utc, end_of_day_utc),
+        Order.status.in_(['paid', 'cancelled'])
+    ).options(*order_graph_options()).order_by(Order.created_at.desc()).all()
+    orders_data = [{'order': order.to_dict(), 'waiter_name': order.waiter.full_name if order.waiter else 'N/A'} for order in orders]
+
     return render_template('admin/daily_close.html', total_sales=total_sales, daily_report=daily_report, today_date=today_date_str, orders_data=orders_data)
\ No newline at end of file
@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
 from app import db
+from app.services.identity_service import remember_identity
+from app.services.password_service import needs_rehash
 import bleach
 
 auth_bp = Blueprint('auth', __name__)
@@ -33,7 +35,12 @@ def login():
         user = User.query.filter_by(username=username, is_active=True).first()
         
         if user and user.check_password(password):
+            if needs_rehash(user.password_hash):
+                # Hash made with an older cost: upgrade it now that we know the password
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
+            remember_identity(user)
             next_page = request.args.get('next')
             if next_page:
                 return redirect(next_page)
@@ -1,11 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from app.models import Product, Order, OrderItem
-from app import db, socketio
+from app.models import Order
+from app import db
+from app.services.catalog_service import get_catalog, get_stock_levels, with_stock
+from app.services.board_service import board_response
+from app.sockets.room_events import capture_sync_state
+from app.services.order_service import order_graph_options
+from app.services.order_lifecycle_service import transition_order, InvalidTransition
 from functools import wraps
 
 cook_bp = Blueprint('cook', __name__)
 
+# Orders shown on the kitchen board
+KITCHEN_STATUSES = ['sent_to_kitchen', 'in_preparation']
+
 def cook_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -19,67 +27,49 @@ def cook_required(f):
 @login_required
 @cook_required
 def dashboard():
+    capture_sync_state('kitchen')
     orders = Order.query.filter(
-        Order.status.in_(['sent_to_kitchen', 'in_preparation'])
-    ).order_by(Order.created_at).all()
+        Order.status.in_(KITCHEN_STATUSES)
+    ).options(*order_graph_options(waiter=False)).order_by(Order.created_at).all()
     
     return render_template('cook/dashboard.html', orders=orders)
 
+@cook_bp.route('/api/orders')
+@login_required
+@cook_required
+def orders_api():
+    """Kitchen board as JSON; supports If-None-Match and ?since= (see board_response)."""
+    return board_response(Order.query, KITCHEN_STATUSES)
+
 @cook_bp.route('/start_preparation/<int:order_id>', methods=['POST'])
 @login_required
 @cook_required
 def start_preparation(order_id):
-    order = Order.query.get_or_404(order_id)
-    
-    if order.status != 'sent_to_kitchen':
+    try:
+        transition_order(order_id, 'in_preparation')
+    except InvalidTransition:
         return jsonify({'success': False, 'message': 'Esta orden no puede ser preparada.'}), 400
-    
-    order.status = 'in_preparation'
+    # Commit publishes order_status_update to waiters and kitchen
     db.session.commit()
     
-    # Emit socket event to both rooms
-    socketio.emit('order_status_update', {
-        'order_id': order.id,
-        'status': 'in_preparation',
-        'customer_name': order.customer_name
-    }, room='waiters')
-    socketio.emit('order_status_update', {
-        'order_id': order.id,
-        'status': 'in_preparation',
-        'customer_name': order.customer_name
-    }, room='kitchen')
-    
     return jsonify({'success': True, 'message': 'Orden marcada como en preparación.'})
 
 @cook_bp.route('/mark_ready/<int:order_id>', methods=['POST'])
 @login_required
 @cook_required
 def mark_ready(order_id):
-    order = Order.query.get_or_404(order_id)
-    
-    if order.status != 'in_preparation':
+    try:
+        transition_order(order_id, 'ready')
+    except InvalidTransition:
         return jsonify({'success': False, 'message': 'Esta orden no está en preparación.'}), 400
-    
-    order.status = 'ready'
+    # Commit publishes order_status_update to waiters and kitchen
     db.session.commit()
     
-    # Emit socket event to both rooms
-    socketio.emit('order_status_update', {
-        'order_id': order.id,
-        'status': 'ready',
-        'customer_name': order.customer_name
-    }, room='waiters')
-    socketio.emit('order_status_update', {
-        'order_id': order.id,
-        'status': 'ready',
-        'customer_name': order.customer_name
-    }, room='kitchen')
-    
     return jsonify({'success': True, 'message': 'Orden marcada como lista.'})
 
 @cook_bp.route('/stock')
 @login_required
 @cook_required
 def stock():
-    products = Product.query.filter(Product.parent_id.is_(None), Product.is_active==True).order_by(Product.category, Product.name).all()
+    products = with_stock(get_catalog()['products'], get_stock_levels())
     return render_template('cook/stock.html', products=products)
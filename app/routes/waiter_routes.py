@@ -1,15 +1,26 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from app.models import Product, Order, OrderItem
-from app import db, socketio
-from datetime import datetime, date
+from app.models import Order, OrderItem, OrderItemExtra
+from app import db
+from datetime import datetime, date, time, timedelta
 import bleach
 import json
 from functools import wraps
-from app.services.report_service import generate_receipt_pdf
+from app.services.receipt_service import receipt_data, receipt_text, receipt_escpos
+from app.services.pdf_service import render_pdf, cached_pdf
+from app.services.order_service import resolve_order_items, order_stock_requirements, order_graph_options
+from app.services.catalog_service import get_catalog, get_stock_levels, with_stock
+from app.services.board_service import board_response
+from app.sockets.room_events import capture_sync_state
+from app.services.stock_service import decrement_stock, restore_stock, InsufficientStockError
+from app.services.sales_rollup_service import record_payment, record_cancellation
+from app.services.order_lifecycle_service import transition_order, InvalidTransition
 
 waiter_bp = Blueprint('waiter', __name__)
 
+# Orders shown on the waiter board
+ACTIVE_STATUSES = ['pending', 'sent_to_kitchen', 'in_preparation', 'ready']
+
 def waiter_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -24,43 +35,53 @@ def waiter_required(f):
 @waiter_required
 def dashboard():
     view_mode = request.args.get('view', 'mine')
-    today = date.today()
+    today_start = datetime.combine(date.today(), time.min)
+    capture_sync_state('waiters')
 
     # Base query for active orders
     active_orders_query = Order.query.filter(
-        Order.status.in_(['pending', 'sent_to_kitchen', 'in_preparation', 'ready'])
+        Order.status.in_(ACTIVE_STATUSES)
     )
 
     # Base query for completed orders (today only)
     completed_orders_query = Order.query.filter(
         Order.status == 'paid',
-        db.func.date(Order.created_at) == today
+        Order.created_at >= today_start,
+        Order.created_at < today_start + timedelta(days=1)
     )
 
     if view_mode == 'mine':
         active_orders_query = active_orders_query.filter(Order.waiter_id == current_user.id)
         completed_orders_query = completed_orders_query.filter(Order.waiter_id == current_user.id)
 
-    active_orders = active_orders_query.order_by(Order.created_at.desc()).all()
-    completed_orders = completed_orders_query.order_by(Order.created_at.desc()).all()
+    # The cards only show the waiter's name
+    active_orders = active_orders_query.options(*order_graph_options(items=False)).order_by(Order.created_at.desc()).all()
+    completed_orders = completed_orders_query.options(*order_graph_options(items=False)).order_by(Order.created_at.desc()).all()
 
     return render_template('waiter/dashboard.html',
                          active_orders=active_orders,
                          completed_orders=completed_orders,
                          view_mode=view_mode)
 
+@waiter_bp.route('/api/orders')
+@login_required
+@waiter_required
+def orders_api():
+    """Active-order board as JSON; supports If-None-Match and ?since= (see board_response)."""
+    scope_query = Order.query
+    if request.args.get('view', 'mine') == 'mine':
+        scope_query = scope_query.filter(Order.waiter_id == current_user.id)
+    return board_response(scope_query, ACTIVE_STATUSES)
+
 @waiter_bp.route('/take_order')
 @login_required
 @waiter_required
 def take_order():
-    # Fetch products that are directly sellable
-    products = Product.query.filter(
-        Product.parent_id.is_(None), 
-        Product.is_active==True, 
-        Product.category != 'Extra'
-    ).order_by(Product.category, Product.name).all()
-    
-    extras = Product.query.filter_by(is_active=True, category='Extra').order_by(Product.name).all()
+    # Menu structure comes from the catalog cache, stock is always read live
+    catalog = get_catalog()
+    stock_levels = get_stock_levels()
+    products = with_stock([p for p in catalog['products'] if p['category'] != 'Extra'], stock_levels)
+    extras = with_stock([p for p in catalog['products'] if p['category'] == 'Extra'], stock_levels)
     return render_template('waiter/take_order.html', products=products, extras=extras)
 
 @waiter_bp.route('/create_order', methods=['POST'])
@@ -77,39 +98,17 @@ def create_order():
             return redirect(url_for('waiter.take_order'))
 
         parsed_items = [json.loads(item) for item in items_data]
-        
-        # --- Stock Validation --- #
-        stock_requirements = {}
-
-        for item_data in parsed_items:
-            product = Product.query.get(int(item_data['product_id']))
-            quantity = int(item_data['quantity'])
-
-            if product.category == 'Combo':
-                for component_item in product.components:
-                    comp = component_item.component
-                    base_product = comp.parent if not comp.is_base_product else comp
-                    consumption = comp.stock_consumption if not comp.is_base_product else 1
-                    total_consumption = consumption * component_item.quantity * quantity
-                    stock_requirements[base_product.id] = stock_requirements.get(base_product.id, 0) + total_consumption
-            elif product.is_base_product:
-                stock_requirements[product.id] = stock_requirements.get(product.id, 0) + quantity
-            else: # Is a variant
-                parent_id = product.parent_id
-                consumption = product.stock_consumption * quantity
-                stock_requirements[parent_id] = stock_requirements.get(parent_id, 0) + consumption
 
-            # Handle extras stock
-            for extra_data in item_data.get('extras', []):
-                extra = Product.query.get(int(extra_data['id']))
-                extra_quantity = int(extra_data['quantity'])
-                stock_requirements[extra.id] = stock_requirements.get(extra.id, 0) + (extra_quantity * quantity)
+        # --- Resolve prices and stock needs from the catalog --- #
+        lines, stock_requirements = resolve_order_items(parsed_items)
 
-        for product_id, required_stock in stock_requirements.items():
-            product_to_check = Product.query.get(product_id)
-            if not product_to_check or product_to_check.stock < required_stock:
-                flash(f'Stock insuficiente para {product_to_check.name if product_to_check else "producto"}. Pedido: {required_stock}, Disponible: {product_to_check.stock if product_to_check else 0}', 'error')
-                return redirect(url_for('waiter.take_order'))
+        # --- Take Stock (atomic, fails if any product is short) --- #
+        try:
+            decrement_stock(stock_requirements)
+        except InsufficientStockError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('waiter.take_order'))
 
         # --- Create Order and Items --- #
         order = Order(customer_name=customer_name, customer_phone=customer_phone, waiter_id=current_user.id)
@@ -117,32 +116,14 @@ def create_order():
         db.session.flush()
 
         grand_total = 0
-        for item_data in parsed_items:
-            product = Product.query.get(int(item_data['product_id']))
-            quantity = int(item_data['quantity'])
-            notes = item_data.get('notes', '')
-            extras_data = item_data.get('extras', [])
-
-            item_price = product.price
-            # Always add extras price, regardless of category
-            for extra in extras_data:
-                extra_product = Product.query.get(extra['id'])
-                if extra_product:
-                    item_price += extra_product.price * int(extra['quantity'])
-
-            order_item = OrderItem(order_id=order.id, product_id=product.id, quantity=quantity, unit_price=item_price, extras=json.dumps(extras_data), notes=notes)
+        for line in lines:
+            order_item = OrderItem(order_id=order.id, product_id=line['product_id'], quantity=line['quantity'], unit_price=line['unit_price'], notes=line['notes'],
+                                   extras=[OrderItemExtra(extra_product_id=extra['product_id'], quantity=extra['quantity'], unit_price=extra['unit_price']) for extra in line['extras']])
             db.session.add(order_item)
-            grand_total += item_price * quantity
+            grand_total += line['unit_price'] * line['quantity']
         
         order.total = grand_total
 
-        # --- Decrement Stock --- #
-        for product_id, consumed_stock in stock_requirements.items():
-            product_to_update = Product.query.get(product_id)
-            if product_to_update:
-                product_to_update.stock -= consumed_stock
-                socketio.emit('stock_update', {'product_id': product_to_update.id, 'stock': product_to_update.stock})
-
         db.session.commit()
         flash('Orden creada exitosamente.', 'success')
         return redirect(url_for('waiter.view_order', order_id=order.id))
@@ -156,33 +137,20 @@ def create_order():
 @login_required
 @waiter_required
 def view_order(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(*order_graph_options()).filter_by(id=order_id).first_or_404()
     return render_template('waiter/view_order.html', order=order)
 
 @waiter_bp.route('/send_to_kitchen/<int:order_id>', methods=['POST'])
 @login_required
 @waiter_required
 def send_to_kitchen(order_id):
-    order = Order.query.get_or_404(order_id)
-    if order.status != 'pending':
+    try:
+        transition_order(order_id, 'sent_to_kitchen')
+    except InvalidTransition:
         flash('Esta orden ya fue enviada a cocina.', 'error')
         return redirect(url_for('waiter.view_order', order_id=order_id))
-    order.status = 'sent_to_kitchen'
+    # Commit publishes new_order to the kitchen
     db.session.commit()
-    def get_display_name(product):
-        if not product.is_base_product and product.parent:
-            return f"{product.parent.name} ({product.name})"
-        return product.name
-    socketio.emit('new_order', {
-        'order_id': order.id,
-        'customer_name': order.customer_name,
-        'items': [{
-            'product_name': get_display_name(item.product),
-            'quantity': item.quantity,
-            'extras': item.extras,
-            'notes': item.notes
-        } for item in order.items]
-    }, room='kitchen')
     flash('Orden enviada a cocina exitosamente.', 'success')
     return redirect(url_for('waiter.dashboard'))
 
@@ -190,45 +158,18 @@ def send_to_kitchen(order_id):
 @login_required
 @waiter_required
 def cancel_order(order_id):
-    order = Order.query.get_or_404(order_id)
-    if order.status not in ['pending', 'sent_to_kitchen']:
+    # Only one of two concurrent cancellations gets past the compare-and-set,
+    # so the stock cannot be restored twice
+    try:
+        order = transition_order(order_id, 'cancelled')
+    except InvalidTransition:
         flash('No se puede cancelar esta orden.', 'error')
         return redirect(url_for('waiter.view_order', order_id=order_id))
     
-    # Restore stock
-    for item in order.items:
-        product = item.product
-        if product.category == 'Combo':
-            for component_item in product.components:
-                comp = component_item.component
-                base_product = comp.parent if not comp.is_base_product else comp
-                consumption = comp.stock_consumption if not comp.is_base_product else 1
-                total_to_restore = consumption * component_item.quantity * item.quantity
-                base_product.stock += total_to_restore
-                socketio.emit('stock_update', {'product_id': base_product.id, 'stock': base_product.stock})
-        elif product.is_base_product:
-            product.stock += item.quantity
-            socketio.emit('stock_update', {'product_id': product.id, 'stock': product.stock})
-        else: # It's a variant
-            parent = product.parent
-            if parent:
-                parent.stock += product.stock_consumption * item.quantity
-                socketio.emit('stock_update', {'product_id': parent.id, 'stock': parent.stock})
-
-        # Restore stock for extras
-        if item.extras:
-            try:
-                extras_list = json.loads(item.extras)
-                for extra_data in extras_list:
-                    extra_product = Product.query.get(extra_data.get('id'))
-                    if extra_product:
-                        extra_quantity = int(extra_data.get('quantity', 1))
-                        extra_product.stock += extra_quantity * item.quantity
-                        socketio.emit('stock_update', {'product_id': extra_product.id, 'stock': extra_product.stock})
-            except (json.JSONDecodeError, TypeError):
-                pass
+    # Give back the stock held by the order
+    restore_stock(order_stock_requirements(order.id))
     
-    order.status = 'cancelled'
+    record_cancellation(order)
     db.session.commit()
     flash('Orden cancelada y stock restaurado.', 'success')
     return redirect(url_for('waiter.dashboard'))
@@ -237,7 +178,7 @@ def cancel_order(order_id):
 @login_required
 @waiter_required
 def process_payment(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(*order_graph_options()).filter_by(id=order_id).first_or_404()
     if order.status != 'ready':
         flash('La orden debe estar lista para procesar el pago.', 'error')
         return redirect(url_for('waiter.view_order', order_id=order_id))
@@ -249,12 +190,19 @@ def process_payment(order_id):
                 flash('El efectivo recibido es menor al total de la orden.', 'error')
                 return render_template('waiter/process_payment.html', order=order)
             change = cash_received - order.total
-            order.status = 'paid'
-            order.cash_received = cash_received
-            order.change_given = change
+            # The compare-and-set lets only one of two double submits record the sale
+            try:
+                transition_order(order.id, 'paid', cash_received=cash_received, change_given=change)
+            except InvalidTransition:
+                flash('La orden debe estar lista para procesar el pago.', 'error')
+                return redirect(url_for('waiter.view_order', order_id=order_id))
+            record_payment(order)
+            # Plain-text ticket ready to print right away, without a PDF build.
+            # Built before the commit, which expires the order graph.
+            ticket = receipt_text(receipt_data(order, cash_received, change))
             db.session.commit()
             flash('Pago procesado exitosamente.', 'success')
-            return render_template('waiter/payment_receipt.html', order=order, cash_received=cash_received, change=change)
+            return render_template('waiter/payment_receipt.html', order=order, cash_received=cash_received, change=change, ticket=ticket)
         except (ValueError, TypeError):
             flash('Monto de efectivo inválido.', 'error')
             return render_template('waiter/process_payment.html', order=order)
@@ -264,11 +212,29 @@ def process_payment(order_id):
 @login_required
 @waiter_required
 def receipt_pdf(order_id):
-    order = Order.query.get_or_404(order_id)
-    cash_received = request.args.get('cash_received', default=order.cash_received or 0, type=float)
-    change = request.args.get('change', default=order.change_given or 0, type=float)
+    # A paid receipt never changes: it is cached by order id alone and always
+    # shows the stored amounts, so after the first render it is served
+    # without any query. Only paid orders are ever rendered into the cache.
+    pdf = cached_pdf('receipt', str(order_id))
+    if pdf is None:
+        order = Order.query.options(*order_graph_options()).filter_by(id=order_id).first_or_404()
+        if order.status != 'paid':
+            flash('La orden no ha sido pagada.', 'error')
+            return redirect(url_for('waiter.view_order', order_id=order_id))
+        receipt = receipt_data(order, order.cash_received or 0, order.change_given or 0)
+        pdf = render_pdf('receipt', receipt, identity=str(order_id))
+    return pdf, 200, {'Content-Type': 'application/pdf', 'Content-Disposition': f'inline; filename=recibo_orden_{order_id}.pdf'}
+
+@waiter_bp.route('/receipt/<int:order_id>/ticket')
+@login_required
+@waiter_required
+def receipt_ticket(order_id):
+    """Receipt for the thermal printer: raw ESC/POS bytes, or plain text with ?format=txt."""
+    order = Order.query.options(*order_graph_options()).filter_by(id=order_id).first_or_404()
     if order.status != 'paid':
         flash('La orden no ha sido pagada.', 'error')
         return redirect(url_for('waiter.view_order', order_id=order_id))
-    pdf_buffer = generate_receipt_pdf(order, cash_received, change)
-    return pdf_buffer, 200, {'Content-Type': 'application/pdf', 'Content-Disposition': f'inline; filename=recibo_orden_{order.id}.pdf'}
+    receipt = receipt_data(order, order.cash_received or 0, order.change_given or 0)
+    if request.args.get('format') == 'txt':
+        return receipt_text(receipt), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return receipt_escpos(receipt), 200, {'Content-Type': 'application/octet-stream', 'Content-Disposition': f'attachment; filename=recibo_orden_{order.id}.bin'}
@@ -0,0 +1,97 @@
+from flask import request, jsonify, make_response
+from datetime import datetime
+from hashlib import md5
+from sqlalchemy.orm import selectinload
+from app import db
+from app.models import Order, OrderItem
+from app.services.catalog_service import get_catalog
+
+# Last time an order row changed; updated_at is only set after the first update
+order_changed_at = db.func.coalesce(Order.updated_at, Order.created_at)
+
+
+def display_name(product_id, catalog):
+    """Variant names include their base product, e.g. 'Pollo (Pieza)'."""
+    product = catalog['by_id'].get(product_id)
+    if product is None:
+        return None
+    parent = catalog['by_id'].get(product['parent_id']) if product['parent_id'] else None
+    if parent:
+        return f"{parent['name']} ({product['name']})"
+    return product['name']
+
+
+def serialize_board_order(order, catalog):
+    return {
+        'id': order.id,
+        'customer_name': order.customer_name,
+        'status': order.status,
+        'total': order.total,
+        'waiter_id': order.waiter_id,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+        'items': [{
+            'id': item.id,
+            'product_id': item.product_id,
+            'product_name': display_name(item.product_id, catalog),
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'extras': [{
+                'product_id': extra.extra_product_id,
+                'name': display_name(extra.extra_product_id, catalog),
+                'quantity': extra.quantity,
+                'unit_price': extra.unit_price
+            } for extra in item.extras],
+            'notes': item.notes
+        } for item in order.items]
+    }
+
+
+def board_response(scope_query, statuses):
+    """
+    JSON response for an active-order board.
+
+    scope_query is an Order query already restricted to what the caller may
+    see (e.g. one waiter's orders). Without parameters the response holds the
+    orders in `statuses`; with ?since=<ISO timestamp> it holds every order of
+    the scope changed after that instant, whatever its status, so the client
+    can also drop orders that left the board.
+
+    The ETag comes from one aggregate query: the number of orders on the board
+    and the last change of any order of the scope. Every transition moves the
+    last change, including an order leaving the board, so the same
+    `last_change` comes back until something changes. A client polling with
+    If-None-Match gets a 304 without any order rows being loaded.
+    """
+    since_arg = request.args.get('since')
+    since = None
+    if since_arg:
+        try:
+            since = datetime.fromisoformat(since_arg)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Parámetro since inválido.'}), 400
+
+    active_count, last_change = db.session.execute(db.select(
+        scope_query.filter(Order.status.in_(statuses)).with_entities(db.func.count(Order.id)).scalar_subquery(),
+        scope_query.with_entities(db.func.max(order_changed_at)).scalar_subquery()
+    )).one()
+    last_change_str = last_change.isoformat() if last_change else None
+    etag = md5(f"{request.full_path}|{active_count}|{last_change_str}".encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        if since is not None:
+            orders_query = scope_query.filter(order_changed_at > since)
+        else:
+            orders_query = scope_query.filter(Order.status.in_(statuses))
+        orders = orders_query.options(selectinload(Order.items).selectinload(OrderItem.extras)).order_by(Order.created_at).all()
+        catalog = get_catalog()
+        response = jsonify({
+            'orders': [serialize_board_order(order, catalog) for order in orders],
+            'last_change': last_change_str
+        })
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,121 @@
+from app import db
+from app.models import Product, ComboItem, CatalogVersion
+from app.services.db_utils import upsert_increment
+
+# Per-process copy of the menu structure (names, prices, variants, combo
+# recipes). Stock is deliberately left out: it changes with every order and is
+# always read live and merged in by with_stock().
+_catalog_cache = {'version': None, 'catalog': None}
+
+
+def current_catalog_version():
+    version = db.session.query(CatalogVersion.version).filter(CatalogVersion.id == 1).scalar()
+    return version or 0
+
+
+def bump_catalog_version():
+    """
+    Marks the cached catalog as stale in every process. Call it inside the
+    same transaction as the menu change so a rollback leaves the version alone.
+    """
+    # The first bump creates the row; two admins saving at the same time
+    # cannot both try to insert it
+    upsert_increment(CatalogVersion, {'id': 1}, {'version': 1})
+
+
+def _product_entry(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'category': product.category,
+        'parent_id': product.parent_id,
+        'stock_consumption': product.stock_consumption,
+        'is_active': product.is_active,
+        'variants': [],
+        'components': []
+    }
+
+
+def _base_units(entry):
+    # A variant draws from its parent's stock; anything else from its own.
+    if entry['parent_id'] is None:
+        return {entry['id']: 1}
+    return {entry['parent_id']: entry['stock_consumption']}
+
+
+def _build_consumption(entries):
+    """
+    Flattens every sellable product into the base stock one unit of it takes:
+    {product_id: {base_product_id: units}}. Combos are expanded through their
+    recipe here, once, instead of on every order.
+    """
+    consumption = {}
+    for entry in entries.values():
+        if entry['category'] == 'Combo':
+            units = {}
+            for combo_item in entry['components']:
+                for base_id, base_units in _base_units(combo_item['component']).items():
+                    units[base_id] = units.get(base_id, 0) + base_units * combo_item['quantity']
+        else:
+            units = _base_units(entry)
+        consumption[entry['id']] = units
+    return consumption
+
+
+def _build_catalog():
+    products = Product.query.order_by(Product.category, Product.name).all()
+    combo_items = ComboItem.query.order_by(ComboItem.id).all()
+
+    entries = {p.id: _product_entry(p) for p in products}
+    for product in products:
+        if product.parent_id is not None and product.is_active and product.parent_id in entries:
+            entries[product.parent_id]['variants'].append(entries[product.id])
+    for combo_item in combo_items:
+        combo = entries.get(combo_item.combo_product_id)
+        component = entries.get(combo_item.component_product_id)
+        if combo is not None and component is not None:
+            combo['components'].append({
+                'component': component,
+                'component_product_id': combo_item.component_product_id,
+                'quantity': combo_item.quantity
+            })
+
+    base_products = [entries[p.id] for p in products if p.parent_id is None and p.is_active]
+    return {
+        'products': base_products,
+        'by_id': entries,
+        'consumption': _build_consumption(entries)
+    }
+
+
+def get_catalog():
+    """
+    Returns the cached menu graph, rebuilding it (two queries) only when the
+    catalog version stored in the database has moved since the last build.
+
+    The result is shared between requests and must be treated as read-only:
+    - products: active base products (variants and combo components nested),
+      ordered by category and name.
+    - by_id: every product entry, active or not, keyed by id.
+    - consumption: base stock taken by one unit of each product, keyed by
+      product id (see _build_consumption).
+    """
+    version = current_catalog_version()
+    if _catalog_cache['version'] != version or _catalog_cache['catalog'] is None:
+        _catalog_cache['catalog'] = _build_catalog()
+        _catalog_cache['version'] = version
+    return _catalog_cache['catalog']
+
+
+def get_stock_levels():
+    """Returns the live stock of every active base product, keyed by id."""
+    rows = db.session.query(Product.id, Product.stock).filter(
+        Product.parent_id.is_(None), Product.is_active == True
+    ).all()
+    return {row.id: row.stock for row in rows}
+
+
+def with_stock(entries, stock_levels):
+    """Returns shallow copies of catalog entries with their live stock filled in."""
+    return [dict(entry, stock=stock_levels.get(entry['id'], 0)) for entry in entries]
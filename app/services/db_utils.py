@@ -0,0 +1,21 @@
+from app import db
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def upsert_increment(model, keys, increments):
+    """
+    Adds `increments` ({column: amount}) to the row of `model` with `keys`
+    ({column: value}), creating it with those amounts if it does not exist.
+
+    One INSERT ... ON CONFLICT DO UPDATE does both atomically, so two
+    transactions doing it at the same time cannot lose an increment or both
+    try to insert the row. The key columns must have a unique constraint.
+    """
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = insert(model).values(**keys, **increments)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: getattr(model, column) + statement.excluded[column] for column in increments}
+    )
+    db.session.execute(statement)
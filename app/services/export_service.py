@@ -0,0 +1,115 @@
+from app import db
+from app.models import Order, OrderItem, OrderItemExtra, Product, User
+from app.services.sales_rollup_service import local_datetime
+from sqlalchemy.orm import aliased
+from io import StringIO
+import csv
+import json
+
+EXPORT_COLUMNS = ['order_id', 'created_at', 'status', 'waiter', 'customer_name', 'product',
+                  'quantity', 'unit_price', 'line_total', 'extras', 'notes']
+
+# Rows fetched from the cursor (and written per chunk) at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def _line_extras(item_ids):
+    """{order_item_id: [extras as dicts]} for a batch of order lines, in one query."""
+    rows = db.session.execute(
+        db.select(OrderItemExtra.order_item_id, OrderItemExtra.extra_product_id, Product.name,
+                  OrderItemExtra.quantity, OrderItemExtra.unit_price)
+        .join(Product, Product.id == OrderItemExtra.extra_product_id)
+        .where(OrderItemExtra.order_item_id.in_(item_ids))
+        .order_by(OrderItemExtra.id)
+    )
+    extras = {}
+    for row in rows:
+        extras.setdefault(row.order_item_id, []).append({
+            'product_id': row.extra_product_id,
+            'name': row.name,
+            'quantity': row.quantity,
+            'unit_price': row.unit_price
+        })
+    return extras
+
+
+def _line_dict(row, extras):
+    product = row.product_name
+    if row.parent_name:
+        product = f"{row.parent_name} ({row.product_name})"
+    return {
+        'order_id': row.order_id,
+        'created_at': local_datetime(row.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+        'status': row.status,
+        'waiter': row.waiter or '',
+        'customer_name': row.customer_name or '',
+        'product': product or '',
+        'quantity': row.quantity,
+        'unit_price': row.unit_price,
+        'line_total': round(row.unit_price * row.quantity, 2),
+        'extras': extras,
+        'notes': row.notes or ''
+    }
+
+
+def order_line_rows(start_utc, end_utc, statuses=None):
+    """
+    Yields one dict per order line created in [start_utc, end_utc], oldest
+    first, from a single flat query read through a server-side cursor
+    (stream_results + yield_per): memory stays flat whatever the range. The
+    extras of each fetched batch come from one more query.
+    """
+    ParentProduct = aliased(Product)
+    query = db.select(
+        Order.id.label('order_id'), Order.created_at, Order.status, Order.customer_name,
+        User.full_name.label('waiter'),
+        Product.name.label('product_name'), ParentProduct.name.label('parent_name'),
+        OrderItem.id.label('item_id'), OrderItem.quantity, OrderItem.unit_price, OrderItem.notes
+    ).select_from(OrderItem) \
+        .join(Order, Order.id == OrderItem.order_id) \
+        .outerjoin(User, User.id == Order.waiter_id) \
+        .outerjoin(Product, Product.id == OrderItem.product_id) \
+        .outerjoin(ParentProduct, ParentProduct.id == Product.parent_id) \
+        .where(Order.created_at.between(start_utc, end_utc)) \
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    if statuses:
+        query = query.where(Order.status.in_(statuses))
+
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+    for batch in result.partitions():
+        extras = _line_extras([row.item_id for row in batch])
+        for row in batch:
+            yield _line_dict(row, extras.get(row.item_id, []))
+
+
+def csv_chunks(rows):
+    """Encodes rows as CSV text chunks of EXPORT_BATCH_SIZE lines, header first."""
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    # BOM so Excel opens the accents correctly
+    buffer.write('\ufeff')
+    writer.writeheader()
+    # Header goes out before the query runs, so the download starts at once
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, start=1):
+        extras = ', '.join(f"{extra['name']} (x{extra['quantity']})" for extra in row['extras'])
+        writer.writerow(dict(row, extras=extras))
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    """Encodes rows as newline-delimited JSON, extras as a list of objects."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
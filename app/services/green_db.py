@@ -0,0 +1,35 @@
+from app.services.green import monkey_patched
+
+
+def _wait(conn, timeout=None):
+    # psycopg2 calls this whenever a query would block: instead of waiting
+    # inside libpq (and holding the whole hub), poll the connection and park
+    # this green thread on its socket until Postgres answers.
+    from eventlet.hubs import trampoline
+    from psycopg2 import OperationalError, extensions
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Resultado inesperado de poll(): {state!r}")
+
+
+def enable_green_psycopg2(app):
+    """
+    Makes psycopg2 cooperative with eventlet (the psycogreen approach): a
+    query only suspends the green thread that issued it, so a slow report no
+    longer freezes every socket of the worker. Applies to Postgres under a
+    monkey-patched eventlet worker and when DB_GREEN is on; returns whether
+    it was enabled.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI'] or ''
+    if not (app.config['DB_GREEN'] and uri.startswith('postgres') and monkey_patched('socket')):
+        return False
+    from psycopg2 import extensions
+    extensions.set_wait_callback(_wait)
+    return True
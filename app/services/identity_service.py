@@ -0,0 +1,64 @@
+from flask import current_app
+from flask_login import UserMixin
+from app import db
+from app.models import User
+import time
+
+# {user_id: (UserIdentity or None, expires_at)}. Per process: a change made
+# in another worker is seen here once the entry expires, so USER_CACHE_TTL is
+# kept short (seconds). That still serves the bursts of requests and polls of
+# one screen from memory.
+_identities = {}
+
+
+class UserIdentity(UserMixin):
+    """
+    What requests and socket handlers need from the logged-in user. A plain
+    object, not bound to any session, so it can be shared between requests.
+    """
+
+    def __init__(self, id, role, full_name, is_active):
+        self.id = id
+        self.role = role
+        self.full_name = full_name
+        self._is_active = is_active
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+
+def _identity_of(user):
+    return UserIdentity(user.id, user.role, user.full_name, bool(user.is_active))
+
+
+def _store(user_id, identity):
+    _identities[user_id] = (identity, time.monotonic() + current_app.config['USER_CACHE_TTL'])
+
+
+def load_identity(user_id):
+    """
+    Flask-Login user loader: the identity of an active user, or None so the
+    session is treated as logged out. Served from memory while the entry is
+    fresh; only a miss or an expired entry reads the user row.
+    """
+    cached = _identities.get(user_id)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    row = db.session.execute(
+        db.select(User.id, User.role, User.full_name, User.is_active).where(User.id == user_id)
+    ).first()
+    identity = _identity_of(row) if row is not None and row.is_active else None
+    _store(user_id, identity)
+    return identity
+
+
+def remember_identity(user):
+    """Caches a user just authenticated, so the requests after login skip the lookup."""
+    _store(user.id, _identity_of(user))
+
+
+def invalidate_identity(user_id):
+    """Drops a cached identity after its user row changed."""
+    _identities.pop(user_id, None)
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from flask import g, request
+from app.services.query_counter import request_query_count, request_query_seconds
+
+# Metrics live in memory and are per process: with several gunicorn workers
+# each one reports its own requests and sockets.
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Room label of emits without a room (broadcast to every client) and of
+# connected clients that joined none
+BROADCAST = 'all'
+NO_ROOM = 'none'
+
+_lock = Lock()
+# {sid: room} of the Socket.IO clients connected to this process, and how
+# many there are per room
+_connections = {}
+_room_clients = {}
+
+
+class _Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # {label values: [count per bucket (last one is +Inf), sum]}
+        self.series = {}
+
+    def observe(self, values, amount):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0]
+        series[0][bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, (counts, total) in sorted(self.series.items()):
+            labels = _labels(self.labels, values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class _Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, total in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, values)}}} {total}')
+        return lines
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_request_seconds = _Histogram('ms_http_request_duration_seconds', 'Duración de las peticiones HTTP por endpoint.',
+                              ('endpoint', 'method'), _LATENCY_BUCKETS)
+_requests = _Counter('ms_http_requests_total', 'Peticiones HTTP por endpoint y código de respuesta.',
+                     ('endpoint', 'method', 'status'))
+_request_statements = _Histogram('ms_db_statements_per_request', 'Sentencias SQL ejecutadas por petición.',
+                                 ('endpoint',), _STATEMENT_BUCKETS)
+_request_db_seconds = _Histogram('ms_db_seconds_per_request', 'Tiempo total en sentencias SQL por petición.',
+                                 ('endpoint',), _LATENCY_BUCKETS)
+_emits = _Counter('ms_socketio_emits_total', 'Eventos Socket.IO emitidos por evento y sala.', ('event', 'room'))
+_emit_recipients = _Counter('ms_socketio_emit_recipients_total',
+                            'Clientes de este proceso a los que se envió cada evento.', ('event', 'room'))
+
+
+def _start_request():
+    g.metrics_started = perf_counter()
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    elapsed = perf_counter() - started
+    # Route name, not the URL: ids in paths would make one series per order
+    endpoint = request.endpoint or 'unmatched'
+    with _lock:
+        _request_seconds.observe((endpoint, request.method), elapsed)
+        _requests.inc((endpoint, request.method, response.status_code))
+        _request_statements.observe((endpoint,), request_query_count())
+        _request_db_seconds.observe((endpoint,), request_query_seconds())
+    return response
+
+
+def record_emit(event, room=None):
+    """Counts an emit and the clients of this process it reaches."""
+    room = room or BROADCAST
+    with _lock:
+        recipients = len(_connections) if room == BROADCAST else _room_clients.get(room, 0)
+        _emits.inc((event, room))
+        _emit_recipients.inc((event, room), recipients)
+
+
+def client_connected(sid, room):
+    room = room or NO_ROOM
+    with _lock:
+        _connections[sid] = room
+        _room_clients[room] = _room_clients.get(room, 0) + 1
+
+
+def client_disconnected(sid):
+    with _lock:
+        room = _connections.pop(sid, None)
+        if room is not None:
+            _room_clients[room] -= 1
+
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text format."""
+    with _lock:
+        lines = []
+        for metric in (_request_seconds, _requests, _request_statements, _request_db_seconds, _emits, _emit_recipients):
+            lines.extend(metric.render())
+        rooms = dict(_room_clients)
+    lines.append('# HELP ms_socketio_connected_clients Clientes Socket.IO conectados a este proceso por sala.')
+    lines.append('# TYPE ms_socketio_connected_clients gauge')
+    for room, count in sorted(rooms.items()):
+        lines.append(f'ms_socketio_connected_clients{{room="{_escape(room)}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics(app):
+    """
+    Records the latency, status and SQL statement count and time of every
+    request (see /admin/metrics). A few dictionary updates per request; the
+    SQL time comes from the query counter's engine events.
+    """
+    if app.config['METRICS_ENABLED']:
+        app.before_request(_start_request)
+        app.after_request(_finish_request)
@@ -0,0 +1,131 @@
+from flask import abort
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
+from app import db
+from app.models import Order, OrderItem, clock_now
+from app.services.board_service import display_name
+from app.services.catalog_service import get_catalog
+from app.sockets.room_events import emit_to_room, request_reload
+import logging
+
+_PENDING_KEY = 'pending_order_events'
+
+# Statuses an order can move to from each status. 'paid' and 'cancelled'
+# are final.
+TRANSITIONS = {
+    'pending': ('sent_to_kitchen', 'cancelled'),
+    'sent_to_kitchen': ('in_preparation', 'cancelled'),
+    'in_preparation': ('ready',),
+    'ready': ('paid',),
+}
+
+# Socket.IO event published when an order enters a status, and its rooms
+STATUS_EVENTS = {
+    'sent_to_kitchen': ('new_order', ('kitchen',)),
+    'in_preparation': ('order_status_update', ('waiters', 'kitchen')),
+    'ready': ('order_status_update', ('waiters', 'kitchen')),
+}
+
+
+class InvalidTransition(Exception):
+    """Raised when an order is not in a status it can leave for `to_status`
+    (e.g. another cook moved it first). `current` is the status it has."""
+
+    def __init__(self, order_id, to_status, current):
+        self.order_id = order_id
+        self.to_status = to_status
+        self.current = current
+        super().__init__(f"La orden {order_id} no puede pasar de '{current}' a '{to_status}'")
+
+
+def previous_statuses(to_status):
+    """Statuses from which TRANSITIONS allows moving to `to_status`."""
+    return [status for status, targets in TRANSITIONS.items() if to_status in targets]
+
+
+def transition_order(order_id, to_status, **values):
+    """
+    Moves an order to `to_status` with one compare-and-set statement:
+
+        UPDATE order SET status = :to, updated_at = clock_timestamp(), ...values
+        WHERE id = :id AND status IN (:allowed from statuses) RETURNING ...
+
+    Two requests racing on the same order (two cooks, a double submit) cannot
+    both succeed: the second one waits for the first one's row lock and then
+    finds a status it cannot leave. Extra column values (e.g. cash_received)
+    are written by the same statement.
+
+    Returns the row (id, status, customer_name, total, created_at). Raises
+    InvalidTransition if the order is in another status and aborts with 404
+    if it does not exist. The event of the new status (STATUS_EVENTS) is
+    published once the caller commits and dropped if it rolls back.
+    """
+    from_statuses = previous_statuses(to_status)
+    if not from_statuses:
+        raise ValueError(f"Estado de orden desconocido: {to_status}")
+    row = db.session.execute(
+        db.update(Order)
+        .where(Order.id == order_id, Order.status.in_(from_statuses))
+        .values(status=to_status, updated_at=clock_now(), **values)
+        .returning(Order.id, Order.status, Order.customer_name, Order.total, Order.created_at)
+    ).first()
+    if row is None:
+        current = db.session.scalar(db.select(Order.status).where(Order.id == order_id))
+        if current is None:
+            abort(404)
+        raise InvalidTransition(order_id, to_status, current)
+
+    if to_status in STATUS_EVENTS:
+        name, rooms = STATUS_EVENTS[to_status]
+        data = _new_order_event(row) if name == 'new_order' else {
+            'order_id': row.id,
+            'status': row.status,
+            'customer_name': row.customer_name
+        }
+        pending = db.session().info.setdefault(_PENDING_KEY, [])
+        pending.extend((name, data, room) for room in rooms)
+    return row
+
+
+def _new_order_event(row):
+    # The kitchen ticket: lines and extras in two SELECTs, names from the catalog
+    items = OrderItem.query.filter_by(order_id=row.id) \
+        .options(selectinload(OrderItem.extras)).order_by(OrderItem.id).all()
+    catalog = get_catalog()
+    return {
+        'order_id': row.id,
+        'customer_name': row.customer_name,
+        'items': [{
+            'product_name': display_name(item.product_id, catalog),
+            'quantity': item.quantity,
+            'extras': [{
+                'product_id': extra.extra_product_id,
+                'name': display_name(extra.extra_product_id, catalog),
+                'quantity': extra.quantity,
+                'unit_price': extra.unit_price
+            } for extra in item.extras],
+            'notes': item.notes
+        } for item in items]
+    }
+
+
+def _publish_order_events(session):
+    # The change is already committed: a failed emit must not turn the request
+    # into an error the user would retry. The room's clients reload instead.
+    for name, data, room in session.info.pop(_PENDING_KEY, ()):
+        try:
+            emit_to_room(name, data, room)
+        except Exception:
+            logging.exception(f"[SOCKET] No se pudo emitir {name} de la orden {data['order_id']} a la sala {room}")
+            request_reload(room)
+
+
+def _discard_order_events(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_order_events():
+    """Publishes the events queued by transition_order() when their transaction commits."""
+    if not event.contains(db.session, 'after_commit', _publish_order_events):
+        event.listen(db.session, 'after_commit', _publish_order_events)
+        event.listen(db.session, 'after_rollback', _discard_order_events)
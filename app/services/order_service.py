@@ -0,0 +1,157 @@
+from app import db
+from app.models import Order, OrderItem, OrderItemExtra, Product
+from app.services.catalog_service import get_catalog
+from sqlalchemy.orm import selectinload, joinedload
+import json
+
+
+def order_graph_options(items=True, waiter=True):
+    """
+    Loader options for pages that walk order graphs. With items=True the
+    lines, their product and the product's parent (variant names) come in
+    one extra SELECT per query and the lines' extras with their product in
+    another; with waiter=True the waiter is joined in. Rendering a list of
+    orders costs the same handful of queries whatever its length.
+    """
+    options = []
+    if items:
+        options.append(selectinload(Order.items).joinedload(OrderItem.product).joinedload(Product.parent))
+        options.append(selectinload(Order.items).selectinload(OrderItem.extras).joinedload(OrderItemExtra.product))
+    if waiter:
+        options.append(joinedload(Order.waiter))
+    return options
+
+
+def _add_consumption(stock_requirements, units_per_product, quantity):
+    for base_id, units in units_per_product.items():
+        stock_requirements[base_id] = stock_requirements.get(base_id, 0) + units * quantity
+
+
+def resolve_order_items(parsed_items):
+    """
+    Resolves the raw line items posted by the waiter against the catalog.
+
+    Products, extras and their base-stock consumption all come from the cached
+    catalog, so resolving an order costs the catalog version check and nothing
+    more, whatever its size. Prices and stock needs are computed in memory,
+    with one consumption lookup per line and per extra.
+
+    Returns a tuple (lines, stock_requirements):
+    - lines: list of dicts with product_id, quantity, unit_price, extras
+      (dicts with product_id, quantity and unit_price) and notes, ready to
+      build the OrderItem and OrderItemExtra rows.
+    - stock_requirements: dict mapping a base product id to the units of stock
+      the whole order consumes from it.
+    """
+    catalog = get_catalog()
+    products = catalog['by_id']
+    consumption = catalog['consumption']
+
+    product_ids = set()
+    for item_data in parsed_items:
+        product_ids.add(int(item_data['product_id']))
+        for extra_data in item_data.get('extras', []):
+            product_ids.add(int(extra_data['id']))
+    missing = product_ids - products.keys()
+    if missing:
+        raise ValueError(f"Producto no encontrado: {', '.join(str(i) for i in sorted(missing))}")
+
+    lines = []
+    stock_requirements = {}
+    for item_data in parsed_items:
+        product = products[int(item_data['product_id'])]
+        quantity = int(item_data['quantity'])
+
+        _add_consumption(stock_requirements, consumption[product['id']], quantity)
+
+        # Always add extras price, regardless of category
+        unit_price = product['price']
+        extras = []
+        for extra_data in item_data.get('extras', []):
+            extra = products[int(extra_data['id'])]
+            extra_quantity = int(extra_data['quantity'])
+            unit_price += extra['price'] * extra_quantity
+            _add_consumption(stock_requirements, consumption[extra['id']], extra_quantity * quantity)
+            extras.append({'product_id': extra['id'], 'quantity': extra_quantity, 'unit_price': extra['price']})
+
+        lines.append({
+            'product_id': product['id'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'extras': extras,
+            'notes': item_data.get('notes', '')
+        })
+
+    return lines, stock_requirements
+
+
+def order_stock_requirements(order_id):
+    """
+    Returns the base stock held by an already-created order (line products
+    and their extras) as {base_product_id: units}, e.g. to give it back when
+    the order is cancelled. Units per sold product come from one aggregate
+    query; only the catalog's recipe expansion runs in Python.
+    """
+    lines = db.select(OrderItem.product_id, OrderItem.quantity) \
+        .where(OrderItem.order_id == order_id)
+    extras = db.select(OrderItemExtra.extra_product_id, OrderItemExtra.quantity * OrderItem.quantity) \
+        .join(OrderItem, OrderItem.id == OrderItemExtra.order_item_id) \
+        .where(OrderItem.order_id == order_id)
+    sold = db.union_all(lines, extras).subquery()
+    rows = db.session.execute(
+        db.select(sold.c.product_id, db.func.sum(sold.c.quantity)).group_by(sold.c.product_id)
+    )
+
+    consumption = get_catalog()['consumption']
+    stock_requirements = {}
+    for product_id, quantity in rows:
+        _add_consumption(stock_requirements, consumption.get(product_id, {}), quantity)
+    return stock_requirements
+
+
+def backfill_order_item_extras(batch_size=500):
+    """
+    Copies the extras of order lines stored as JSON text (legacy_extras) into
+    order_item_extra rows, batch_size lines at a time, committing each batch.
+    Lines that already have rows are skipped, so it can run again safely.
+    Returns (lines_migrated, extras_skipped): entries whose product no longer
+    exists or that are not JSON cannot be migrated and are only counted.
+    """
+    products = get_catalog()['by_id']
+    migrated = skipped = 0
+    last_id = 0
+    while True:
+        items = db.session.execute(
+            db.select(OrderItem.id, OrderItem.legacy_extras)
+            .where(OrderItem.id > last_id,
+                   OrderItem.legacy_extras.isnot(None),
+                   OrderItem.legacy_extras.notin_(['', '[]']),
+                   ~db.exists().where(OrderItemExtra.order_item_id == OrderItem.id))
+            .order_by(OrderItem.id).limit(batch_size)
+        ).all()
+        if not items:
+            return migrated, skipped
+
+        for item_id, legacy_extras in items:
+            try:
+                extras_list = json.loads(legacy_extras)
+            except (json.JSONDecodeError, TypeError):
+                skipped += 1
+                continue
+            rows = []
+            for extra_data in extras_list if isinstance(extras_list, list) else []:
+                try:
+                    product = products[int(extra_data['id'])]
+                    quantity = int(extra_data.get('quantity', 1))
+                    # Price charged when the order was taken, else today's
+                    unit_price = float(extra_data.get('price', product['price']))
+                except (KeyError, TypeError, ValueError):
+                    skipped += 1
+                    continue
+                rows.append(OrderItemExtra(order_item_id=item_id, extra_product_id=product['id'],
+                                           quantity=quantity, unit_price=unit_price))
+            if rows:
+                db.session.add_all(rows)
+                migrated += 1
+        last_id = items[-1][0]
+        db.session.commit()
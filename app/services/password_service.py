@@ -0,0 +1,43 @@
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.services.green import monkey_patched
+import os
+
+# At most one hash per CPU at a time: more hashing threads would only queue
+# for the CPU and take its share away from the thread running the hub.
+# Created on first use under eventlet.
+_hash_slots = None
+
+
+def _run(fn, *args):
+    # PBKDF2 keeps the CPU busy for the whole hash. Under eventlet that would
+    # stall the hub and every socket it serves, so it runs in eventlet's pool
+    # of native threads (hashlib releases the GIL while hashing) and only the
+    # calling green thread waits.
+    global _hash_slots
+    if monkey_patched('thread'):
+        from eventlet import tpool
+        from eventlet.semaphore import Semaphore
+        if _hash_slots is None:
+            _hash_slots = Semaphore(os.cpu_count() or 1)
+        with _hash_slots:
+            return tpool.execute(fn, *args)
+    return fn(*args)
+
+
+def _hash_method():
+    return f"pbkdf2:sha256:{current_app.config['PASSWORD_HASH_ITERATIONS']}"
+
+
+def hash_password(password):
+    """Hash for a new password with the configured PBKDF2 cost."""
+    return _run(generate_password_hash, password, _hash_method())
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with another method or cost than the configured one."""
+    return password_hash.split('$', 1)[0] != _hash_method()
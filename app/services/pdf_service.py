@@ -0,0 +1,196 @@
+from flask import current_app
+from app.services.green import monkey_patched
+from hashlib import sha256
+from queue import Queue, Empty
+from threading import Lock
+import multiprocessing
+import json
+import os
+import time
+
+# PDFs whose identity fixes their content (paid receipts, closed days) are
+# stored under that identity; everything else under a hash of the data it was
+# rendered from, and pruned after a day.
+_IMMUTABLE_PREFIX = 'i-'
+_HASHED_PREFIX = 'h-'
+_HASHED_MAX_AGE = 24 * 3600
+
+# Render processes of this worker: idle ones wait in the queue. A None in
+# the queue is the free slot of a process that died; whoever takes it
+# starts a new one.
+_idle_workers = Queue()
+_workers_lock = Lock()
+_worker_count = 0
+_last_prune = 0
+
+
+def _render(kind, args):
+    from app.services import report_pdf
+    renderers = {
+        'receipt': report_pdf.generate_receipt_pdf,
+        'daily_report': report_pdf.generate_daily_report_pdf,
+        'sales_report': report_pdf.generate_sales_report_pdf,
+    }
+    return renderers[kind](*args).getvalue()
+
+
+def _worker_main(requests, results):
+    # Render process loop; only plain data crosses the pipes
+    while True:
+        try:
+            request = requests.recv()
+        except EOFError:
+            return
+        try:
+            results.send((True, _render(*request)))
+        except Exception as e:
+            results.send((False, repr(e)))
+
+
+class _RenderWorker:
+    def __init__(self):
+        # spawn: a clean child, without the eventlet monkey-patching or the
+        # database connections of this process. Daemonic, so it exits with us.
+        # One-way pipes: a duplex Pipe is a socketpair, which eventlet turns
+        # non-blocking for the child as well.
+        context = multiprocessing.get_context('spawn')
+        child_requests, self.requests = context.Pipe(duplex=False)
+        self.results, child_results = context.Pipe(duplex=False)
+        self.process = context.Process(target=_worker_main, args=(child_requests, child_results), daemon=True)
+        self.process.start()
+        child_requests.close()
+        child_results.close()
+
+    def render(self, kind, args, timeout):
+        self.requests.send((kind, args))
+        if monkey_patched('thread'):
+            # Park this green thread until the result arrives so the hub keeps
+            # serving requests and sockets while the child renders
+            from eventlet.hubs import trampoline
+            trampoline(self.results.fileno(), read=True, timeout=timeout, timeout_exc=TimeoutError)
+        elif not self.results.poll(timeout):
+            raise TimeoutError
+        ok, result = self.results.recv()
+        if not ok:
+            raise RuntimeError(f'Error al generar el PDF: {result}')
+        return result
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.requests.close()
+        self.results.close()
+
+
+def _acquire_worker():
+    global _worker_count
+    try:
+        return _idle_workers.get_nowait()
+    except Empty:
+        pass
+    with _workers_lock:
+        if _worker_count < current_app.config['PDF_RENDER_WORKERS']:
+            _worker_count += 1
+            return None
+    return _idle_workers.get()
+
+
+def _render_in_worker(kind, args):
+    worker = _acquire_worker()
+    try:
+        if worker is None:
+            worker = _RenderWorker()
+        result = worker.render(kind, args, current_app.config['PDF_RENDER_TIMEOUT'])
+    except RuntimeError:
+        # The child reported a render error and is still usable
+        _idle_workers.put(worker)
+        raise
+    except BaseException as e:
+        # The process died, is stuck (TimeoutError) or the wait was cut short
+        # and its reply may still come: replace it. Its slot goes back to the
+        # queue, which wakes a request waiting for a worker.
+        if worker is not None:
+            worker.kill()
+        _idle_workers.put(None)
+        if isinstance(e, TimeoutError):
+            raise RuntimeError('El PDF tardó demasiado en generarse') from e
+        raise
+    _idle_workers.put(worker)
+    return result
+
+
+def _cache_path(name):
+    cache_dir = current_app.config['PDF_CACHE_DIR']
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(cache_dir, f'{name}.pdf')
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, data):
+    # Write then rename, so a concurrent reader never sees a partial file
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _prune_hashed():
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    cache_dir = current_app.config['PDF_CACHE_DIR']
+    for entry in os.scandir(cache_dir):
+        if entry.name.startswith(_HASHED_PREFIX) and now - entry.stat().st_mtime > _HASHED_MAX_AGE:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def cached_pdf(kind, identity):
+    """Bytes of an immutable PDF rendered earlier, or None. Lets callers skip building its data."""
+    return _read(_cache_path(f'{_IMMUTABLE_PREFIX}{kind}-{identity}'))
+
+
+def render_pdf(kind, *args, identity=None):
+    """
+    Returns the bytes of a report_pdf PDF (`kind` is receipt, daily_report
+    or sales_report, `args` its plain-data arguments).
+
+    Rendering runs in up to PDF_RENDER_WORKERS render processes: ReportLab is
+    CPU bound and would freeze the eventlet worker (and every socket client)
+    while it builds. Waiting for the result only parks the calling green
+    thread. With PDF_RENDER_WORKERS=0 it renders inline.
+
+    The result is cached on disk: under `identity` when given (the PDF can
+    never change), otherwise under a hash of kind and args, so a re-download
+    of unchanged data is read from disk without rendering.
+    """
+    if identity is not None:
+        path = _cache_path(f'{_IMMUTABLE_PREFIX}{kind}-{identity}')
+    else:
+        digest = sha256(json.dumps([kind, args], sort_keys=True, default=str).encode()).hexdigest()
+        path = _cache_path(f'{_HASHED_PREFIX}{kind}-{digest}')
+
+    pdf = _read(path)
+    if pdf is not None:
+        return pdf
+
+    if current_app.config['PDF_RENDER_WORKERS'] > 0:
+        pdf = _render_in_worker(kind, args)
+    else:
+        pdf = _render(kind, args)
+
+    _write(path, pdf)
+    if identity is None:
+        _prune_hashed()
+    return pdf
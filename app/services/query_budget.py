@@ -0,0 +1,126 @@
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import db
+import os
+import sys
+
+# Development and CI tool (see benchmarks/check_query_budgets.py): counts the
+# SQL statements of a block and tells where repeated ones come from. The
+# listeners are only attached while a block is being counted.
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+# Logs of the blocks being counted, and the relationship (if any) whose load
+# is executing right now
+_active_logs = []
+_loading = []
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryLog:
+    """The statements run inside a count_queries() block."""
+
+    def __init__(self):
+        # (sql, origin) pairs, in execution order
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self, min_count=2):
+        """[(sql, times, origins)] of the statements run at least min_count times, most repeated first."""
+        times = Counter(sql for sql, _ in self.statements)
+        origins = {}
+        for sql, origin in self.statements:
+            origins.setdefault(sql, Counter())[origin] += 1
+        return [(sql, n, origins[sql]) for sql, n in times.most_common() if n >= min_count]
+
+    def report(self, min_count=2):
+        lines = []
+        for sql, n, origins in self.repeated(min_count):
+            lines.append(f"  {n}x {' '.join(sql.split())[:160]}")
+            for origin, m in origins.most_common():
+                lines.append(f"      {m}x desde {origin}")
+        return '\n'.join(lines)
+
+
+def _caller():
+    # Innermost frame of the application (a template counts too), skipping
+    # this module; that is where the statement was asked for
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return 'fuera de app/'
+
+
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    origin = _caller()
+    if _loading:
+        origin = f"{_loading[-1]} en {origin}"
+    for log in _active_logs:
+        log.statements.append((statement, origin))
+
+
+def _track_relationship_load(orm_execute_state):
+    if not orm_execute_state.is_relationship_load:
+        return None
+    path = orm_execute_state.loader_strategy_path
+    kind = 'lazy' if orm_execute_state.lazy_loaded_from is not None else 'eager'
+    _loading.append(f"relación {path[-1]} ({kind})")
+    try:
+        # Run the load here so its statements are attributed to the relationship
+        return orm_execute_state.invoke_statement()
+    finally:
+        _loading.pop()
+
+
+@contextmanager
+def count_queries():
+    """Yields a QueryLog of every SQL statement executed inside the block."""
+    log = QueryLog()
+    if not _active_logs:
+        event.listen(Engine, 'before_cursor_execute', _record_statement)
+        event.listen(db.session, 'do_orm_execute', _track_relationship_load)
+    _active_logs.append(log)
+    try:
+        yield log
+    finally:
+        _active_logs.remove(log)
+        if not _active_logs:
+            event.remove(Engine, 'before_cursor_execute', _record_statement)
+            event.remove(db.session, 'do_orm_execute', _track_relationship_load)
+
+
+@contextmanager
+def query_budget(limit, label='bloque'):
+    """
+    Fails with QueryBudgetExceeded when the block runs more than `limit` SQL
+    statements. The error lists the repeated statements and the relationship
+    or line of code that issued each one, which is usually the N+1.
+    """
+    with count_queries() as log:
+        yield log
+    if log.count > limit:
+        raise QueryBudgetExceeded(f"{label}: {log.count} sentencias SQL (presupuesto {limit})\n{log.report()}")
+
+
+def within_query_budget(limit):
+    """Decorator form of query_budget() for a function."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with query_budget(limit, f.__qualname__):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
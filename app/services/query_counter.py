@@ -0,0 +1,45 @@
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from time import perf_counter
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+        g.sql_query_started = perf_counter()
+
+
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        started = g.pop('sql_query_started', None)
+        if started is not None:
+            g.sql_query_seconds = g.get('sql_query_seconds', 0) + perf_counter() - started
+
+
+def request_query_count():
+    """Returns the number of SQL statements run so far in the current app context."""
+    return g.get('sql_query_count', 0)
+
+
+def request_query_seconds():
+    """Returns the seconds spent executing SQL statements so far in the current app context."""
+    return g.get('sql_query_seconds', 0)
+
+
+def register_query_counter(app):
+    """
+    Counts and times the SQL statements of every request. With SQL_QUERY_COUNT_HEADER
+    enabled the count is returned in the X-Query-Count response header, so
+    an N+1 shows up as a count that grows with the page size.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+    if not event.contains(Engine, 'after_cursor_execute', _time_query):
+        event.listen(Engine, 'after_cursor_execute', _time_query)
+
+    if app.config['SQL_QUERY_COUNT_HEADER']:
+        @app.after_request
+        def add_query_count_header(response):
+            response.headers['X-Query-Count'] = str(request_query_count())
+            return response
@@ -0,0 +1,108 @@
+from app.services.sales_rollup_service import local_datetime
+from html import unescape
+import textwrap
+
+# Characters per line of a 58mm thermal printer with the default font
+RECEIPT_WIDTH = 32
+
+# ESC/POS commands
+_ESC_INIT = b'\x1b@'
+_ESC_CODEPAGE_PC850 = b'\x1bt\x02'
+_ESC_ALIGN_LEFT = b'\x1ba\x00'
+_ESC_ALIGN_CENTER = b'\x1ba\x01'
+_ESC_BOLD_ON = b'\x1bE\x01'
+_ESC_BOLD_OFF = b'\x1bE\x00'
+_ESC_FEED_AND_CUT = b'\x1bd\x04' + b'\x1dV\x01'
+
+
+def receipt_data(order, cash_received, change):
+    """
+    Plain data printed on a receipt. Rendering only needs this dict, so it can
+    run in another process and be cached by content.
+    """
+    items = []
+    for item in order.items:
+        # Create descriptive name for variants
+        if not item.product.is_base_product and item.product.parent:
+            description = f"{item.product.parent.name} ({item.product.name})"
+        else:
+            description = item.product.name
+
+        items.append({
+            'quantity': item.quantity,
+            'description': description,
+            'extras': item.extras_label,
+            'total': item.unit_price * item.quantity
+        })
+
+    return {
+        'order_id': order.id,
+        'date': local_datetime(order.created_at).strftime('%d/%m/%Y %H:%M'),
+        'customer_name': order.customer_name or 'N/A',
+        'waiter_name': order.waiter.full_name,
+        'items': items,
+        'total': order.total,
+        'cash_received': cash_received,
+        'change': change
+    }
+
+
+def _amount_line(label, amount, width):
+    value = f"Q{amount:.2f}"
+    return f"{label[:width - len(value) - 1]:<{width - len(value)}}{value}"
+
+
+def _receipt_sections(receipt, width):
+    """(header, body, footer) lines of the ticket: header and footer are centered."""
+    # Names are stored HTML-escaped (bleach); the ticket prints them as plain
+    # text. The PDF receipt passes receipt_data() to Paragraph as markup instead.
+    rule = '-' * width
+    header = ['Restaurante M&S', 'Comprobante de Pago']
+
+    body = [rule,
+            f"Orden #{receipt['order_id']}",
+            f"Fecha: {receipt['date']}"]
+    body += textwrap.wrap(f"Cliente: {unescape(receipt['customer_name'])}", width)
+    body += textwrap.wrap(f"Mesero: {unescape(receipt['waiter_name'])}", width)
+    body.append(rule)
+    for item in receipt['items']:
+        # Quantity and description on the left, line total on the right of the first line
+        lines = textwrap.wrap(f"{item['quantity']} {unescape(item['description'])}", width - 11, subsequent_indent='  ')
+        body.append(_amount_line(lines[0], item['total'], width))
+        body += lines[1:]
+        if item['extras']:
+            body += textwrap.wrap(f"Extras: {unescape(item['extras'])}", width, initial_indent='  ', subsequent_indent='  ')
+    body += [rule,
+             _amount_line('Total:', receipt['total'], width),
+             _amount_line('Efectivo Recibido:', receipt['cash_received'], width),
+             _amount_line('Cambio:', receipt['change'], width),
+             rule]
+
+    footer = ['¡Gracias por su preferencia!']
+    return header, body, footer
+
+
+def receipt_text(receipt, width=RECEIPT_WIDTH):
+    """The receipt as monospaced plain text, `width` characters per line."""
+    header, body, footer = _receipt_sections(receipt, width)
+    lines = [line.center(width).rstrip() for line in header] + body + [line.center(width).rstrip() for line in footer]
+    return '\n'.join(lines) + '\n'
+
+
+def receipt_escpos(receipt, width=RECEIPT_WIDTH):
+    """
+    The receipt as raw ESC/POS bytes for a thermal printer: bold centered
+    header, PC850 code page for the accents, paper feed and cut at the end.
+    """
+    header, body, footer = _receipt_sections(receipt, width)
+
+    def encode(lines):
+        return ''.join(f'{line}\n' for line in lines).encode('cp850', errors='replace')
+
+    return b''.join([
+        _ESC_INIT, _ESC_CODEPAGE_PC850,
+        _ESC_ALIGN_CENTER, _ESC_BOLD_ON, encode(header[:1]), _ESC_BOLD_OFF, encode(header[1:]),
+        _ESC_ALIGN_LEFT, encode(body),
+        _ESC_ALIGN_CENTER, encode(footer),
+        _ESC_FEED_AND_CUT
+    ])
@@ -0,0 +1,200 @@
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib import colors
+from io import BytesIO
+from xml.sax.saxutils import escape
+from html import unescape
+
+# ReportLab styles, built once per process instead of once per PDF
+_styles = getSampleStyleSheet()
+_DAILY_TITLE_STYLE = ParagraphStyle('CustomTitle', parent=_styles['Heading1'], fontSize=18, spaceAfter=30, alignment=1)
+_SALES_TITLE_STYLE = ParagraphStyle('CustomTitle', parent=_styles['Heading1'], fontSize=18, spaceAfter=20, alignment=1)
+_CENTERED_STYLE = ParagraphStyle('centered', alignment=1)
+_RECEIPT_CENTER_STYLE = ParagraphStyle('center', parent=_styles['Normal'], alignment=1)
+_RECEIPT_CENTER_BOLD_STYLE = ParagraphStyle('center_bold', parent=_RECEIPT_CENTER_STYLE, fontName='Helvetica-Bold')
+
+_SUMMARY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+_ORDERS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('ALIGN', (2, 1), (2, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+# Daily report detail: rows per table and the longest items text that fits
+# its column on one line (longer ones are wrapped in a Paragraph)
+_ORDERS_TABLE_CHUNK = 200
+_ORDERS_ITEMS_LINE_CHARS = 45
+
+_RECEIPT_ITEMS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('ALIGN', (0, 1), (0, -1), 'CENTER'), # Quantity
+    ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'), # Total
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+    ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+])
+_RECEIPT_TOTALS_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+])
+
+
+def _orders_detail_tables(orders_data):
+    # LongTables of _ORDERS_TABLE_CHUNK rows with the header repeated on each
+    # page: a single Table is re-measured on every page split, so one huge
+    # table makes the build time grow with the square of the order count.
+    header = ['ID', 'Hora', 'Items', 'Total', 'Estado']
+    tables = []
+    for start in range(0, len(orders_data), _ORDERS_TABLE_CHUNK):
+        table_data = [header]
+        for order in orders_data[start:start + _ORDERS_TABLE_CHUNK]:
+            # Names are stored HTML-escaped (bleach): plain cells are drawn
+            # literally and Paragraph takes markup, so escape exactly once
+            items = unescape(order['items'])
+            if len(items) > _ORDERS_ITEMS_LINE_CHARS:
+                items = Paragraph(escape(items), _styles['Normal'])
+            table_data.append([order['id'], order['time'], items, order['total'], order['status']])
+        table = LongTable(table_data, colWidths=[0.5*inch, 1*inch, 3*inch, 1*inch, 1*inch], repeatRows=1)
+        table.setStyle(_ORDERS_TABLE_STYLE)
+        tables.append(table)
+    return tables
+
+
+def generate_daily_report_pdf(context):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    cash_in_register = context.get('cash_in_register')
+    difference = context.get('difference')
+    total_sales = context.get('total_sales')
+    report_date_str = context.get('report_date_str')
+    orders_data = context.get('orders_data')
+    
+    # Title
+    story.append(Paragraph(f"Reporte Diario - {report_date_str}", _DAILY_TITLE_STYLE))
+    story.append(Spacer(1, 12))
+    
+    # Summary table
+    summary_data = [
+        ['Concepto', 'Monto (Q)'],
+        ['Total de Ventas', f'{total_sales:.2f}'],
+    ]
+    if cash_in_register is not None:
+        summary_data.extend([
+            ['Efectivo en Caja', f'{cash_in_register:.2f}'],
+            ['Diferencia', f'{difference:.2f}']
+        ])
+    
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(_SUMMARY_TABLE_STYLE)
+    
+    story.append(summary_table)
+    story.append(Spacer(1, 20))
+    
+    # Orders detail
+    if orders_data:
+        story.append(Paragraph("Detalle de Órdenes", _styles['Heading2']))
+        story.append(Spacer(1, 12))
+        
+        story.extend(_orders_detail_tables(orders_data))
+    
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+def generate_sales_report_pdf(report_data, period_type):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    story = []
+
+    # Title
+    title = f"Reporte de Ventas {period_type.title()}"
+    story.append(Paragraph(title, _SALES_TITLE_STYLE))
+    story.append(Paragraph(report_data['Periodo'], _CENTERED_STYLE))
+    story.append(Spacer(1, 20))
+
+    # Summary
+    summary_style = _styles['Normal']
+    for key, value in report_data.items():
+        story.append(Paragraph(f"<b>{key}:</b> {value}", summary_style))
+        story.append(Spacer(1, 6))
+
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+def generate_receipt_pdf(receipt):
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=(3 * inch, 5 * inch), topMargin=0.2*inch, bottomMargin=0.2*inch, leftMargin=0.2*inch, rightMargin=0.2*inch)
+    story = []
+
+    center_style = _RECEIPT_CENTER_STYLE
+    center_bold_style = _RECEIPT_CENTER_BOLD_STYLE
+    normal_style = _styles['Normal']
+    
+    # Header
+    story.append(Paragraph("Restaurante M&S", center_bold_style))
+    story.append(Paragraph("Comprobante de Pago", center_style))
+    story.append(Spacer(1, 0.1 * inch))
+    
+    # Order Info
+    story.append(Paragraph(f"Orden #{receipt['order_id']}", normal_style))
+    story.append(Paragraph(f"Fecha: {receipt['date']}", normal_style))
+    story.append(Paragraph(f"Cliente: {receipt['customer_name']}", normal_style))
+    story.append(Paragraph(f"Mesero: {receipt['waiter_name']}", normal_style))
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Items Table
+    items_data = [['Cant.', 'Descripción', 'Total']]
+    for item in receipt['items']:
+        description = item['description']
+        if item['extras']:
+            description += f"<br/><font size='-1'><i>Extras: {item['extras']}</i></font>"
+        items_data.append([
+            item['quantity'],
+            Paragraph(description, normal_style),
+            f"Q{item['total']:.2f}"
+        ])
+
+    items_table = Table(items_data, colWidths=[0.4*inch, 1.6*inch, 0.6*inch])
+    items_table.setStyle(_RECEIPT_ITEMS_TABLE_STYLE)
+    story.append(items_table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Totals
+    totals_data = [
+        ['Total:', f"Q{receipt['total']:.2f}"],
+        ['Efectivo Recibido:', f"Q{receipt['cash_received']:.2f}"],
+        ['Cambio:', f"Q{receipt['change']:.2f}"],
+    ]
+    totals_table = Table(totals_data, colWidths=[1.8*inch, 0.8*inch])
+    totals_table.setStyle(_RECEIPT_TOTALS_TABLE_STYLE)
+    story.append(totals_table)
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Footer
+    story.append(Paragraph("¡Gracias por su preferencia!", center_style))
+
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
@@ -1,208 +1,146 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from io import BytesIO
-from datetime import datetime
-import json
-from zoneinfo import ZoneInfo
-
-def generate_daily_report_pdf(context):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-
-    daily_report = context.get('daily_report')
-    total_sales = context.get('total_sales')
-    report_date_str = context.get('report_date_str')
-    orders_data = context.get('orders_data')
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=1  # Center
-    )
-    
-    story.append(Paragraph(f"Reporte Diario - {report_date_str}", title_style))
-    story.append(Spacer(1, 12))
-    
-    # Summary table
-    summary_data = [
-        ['Concepto', 'Monto (Q)'],
-        ['Total de Ventas', f'{total_sales:.2f}'],
-    ]
-    if daily_report and daily_report.cash_in_register is not None:
-        summary_data.extend([
-            ['Efectivo en Caja', f'{daily_report.cash_in_register:.2f}'],
-            ['Diferencia', f'{daily_report.difference:.2f}']
-        ])
-    
-    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 20))
-    
-    # Orders detail
-    if orders_data:
-        story.append(Paragraph("Detalle de Órdenes", styles['Heading2']))
-        story.append(Spacer(1, 12))
-        
-        orders_data_table = [['ID', 'Hora', 'Items', 'Total', 'Estado']]
-        for order in orders_data:
-            orders_data_table.append([
-                order['id'],
-                order['time'],
-                Paragraph(order['items'], styles['Normal']),
-                order['total'],
-                order['status']
-            ])
-        
-        orders_table = Table(orders_data_table, colWidths=[0.5*inch, 1*inch, 3*inch, 1*inch, 1*inch])
-        orders_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(orders_table)
-    
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
-def generate_sales_report_pdf(report_data, period_type):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=20,
-        alignment=1
-    )
-    title = f"Reporte de Ventas {period_type.title()}"
-    story.append(Paragraph(title, title_style))
-    story.append(Paragraph(report_data['Periodo'], ParagraphStyle('centered', alignment=1)))
-    story.append(Spacer(1, 20))
-
-    # Summary
-    summary_style = styles['Normal']
-    for key, value in report_data.items():
-        story.append(Paragraph(f"<b>{key}:</b> {value}", summary_style))
-        story.append(Spacer(1, 6))
-
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
-def generate_receipt_pdf(order, cash_received, change):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=(3 * inch, 5 * inch), topMargin=0.2*inch, bottomMargin=0.2*inch, leftMargin=0.2*inch, rightMargin=0.2*inch)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # Custom styles
-    center_style = ParagraphStyle('center', parent=styles['Normal'], alignment=1)
-    center_bold_style = ParagraphStyle('center_bold', parent=center_style, fontName='Helvetica-Bold')
-    normal_style = styles['Normal']
-    
-    # Header
-    story.append(Paragraph("Restaurante M&S", center_bold_style))
-    story.append(Paragraph("Comprobante de Pago", center_style))
-    story.append(Spacer(1, 0.1 * inch))
-    
-    # Order Info
-    guatemala_tz = ZoneInfo("America/Guatemala")
-    local_created_at = order.created_at.replace(tzinfo=ZoneInfo("UTC")).astimezone(guatemala_tz)
-    formatted_date = local_created_at.strftime('%d/%m/%Y %H:%M')
-
-    story.append(Paragraph(f"Orden #{order.id}", normal_style))
-    story.append(Paragraph(f"Fecha: {formatted_date}", normal_style))
-    story.append(Paragraph(f"Cliente: {order.customer_name or 'N/A'}", normal_style))
-    story.append(Paragraph(f"Mesero: {order.waiter.full_name}", normal_style))
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Items Table
-    items_data = [['Cant.', 'Descripción', 'Total']]
-    for item in order.items:
-        # Create descriptive name for variants
-        if not item.product.is_base_product and item.product.parent:
-            description = f"{item.product.parent.name} ({item.product.name})"
-        else:
-            description = item.product.name
-
-        if item.extras:
-            try:
-                extras_list = json.loads(item.extras)
-                if extras_list:
-                    extra_names = [f"{extra['name']} (x{extra['quantity']})" for extra in extras_list]
-                    description += f"<br/><font size='-1'><i>Extras: {', '.join(extra_names)}</i></font>"
-            except (json.JSONDecodeError, TypeError):
-                # Fallback for old data that is just a string
-                description += f"<br/><font size='-1'><i>Extras: {item.extras}</i></font>"
-        
-        items_data.append([
-            item.quantity,
-            Paragraph(description, normal_style),
-            f"Q{item.unit_price * item.quantity:.2f}"
-        ])
-
-    items_table = Table(items_data, colWidths=[0.4*inch, 1.6*inch, 0.6*inch])
-    items_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('ALIGN', (0, 1), (0, -1), 'CENTER'), # Quantity
-        ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'), # Total
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-    ]))
-    story.append(items_table)
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Totals
-    totals_data = [
-        ['Total:', f'Q{order.total:.2f}'],
-        ['Efectivo Recibido:', f'Q{cash_received:.2f}'],
-        ['Cambio:', f'Q{change:.2f}'],
-    ]
-    totals_table = Table(totals_data, colWidths=[1.8*inch, 0.8*inch])
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-    ]))
-    story.append(totals_table)
-    story.append(Spacer(1, 0.2 * inch))
-
-    # Footer
-    story.append(Paragraph("¡Gracias por su preferencia!", center_style))
-
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
+from datetime import timedelta
+from itertools import groupby
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Order, OrderItem, Product, SalesDaily, SalesHourly, SalesProductDaily, SalesExtraDaily
+from app.services.catalog_service import get_catalog
+from app.services.sales_rollup_service import local_datetime
+
+# Sales report summaries keyed by (period, start, end). Periods that ended
+# before yesterday can no longer change and stay cached; the current one is
+# revalidated against its rollup change counter on every read.
+_report_cache = {}
+_REPORT_CACHE_SIZE = 32
+
+
+def report_period(period, today):
+    """Returns (start, end, label) of the weekly or monthly period containing today."""
+    if period == 'weekly':
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=6)
+        label = f"Semana del {start.strftime('%d/%m')} al {end.strftime('%d/%m')}"
+    else:  # monthly
+        start = today.replace(day=1)
+        next_month = start.replace(day=28) + timedelta(days=4)
+        end = next_month - timedelta(days=next_month.day)
+        label = f"Mes de {start.strftime('%B de %Y')}"
+    return start, end, label
+
+
+def _period_changes(start, end):
+    # Grows with every order paid or cancelled in the period
+    return db.session.query(
+        db.func.coalesce(db.func.sum(SalesDaily.order_count + SalesDaily.cancelled_count), 0)
+    ).filter(SalesDaily.day.between(start, end)).scalar()
+
+
+def _query_period_summary(start, end):
+    """All report metrics for start..end in a single statement over the rollups."""
+    daily = db.select(SalesDaily).where(SalesDaily.day.between(start, end)).cte('daily')
+    hourly = db.select(
+        SalesHourly.hour, db.func.sum(SalesHourly.total_sales).label('total_sales')
+    ).where(SalesHourly.day.between(start, end)).group_by(SalesHourly.hour).cte('hourly')
+    products = db.select(
+        SalesProductDaily.product_id, db.func.sum(SalesProductDaily.quantity).label('quantity')
+    ).where(SalesProductDaily.day.between(start, end)).group_by(SalesProductDaily.product_id).cte('products')
+    extras = db.select(
+        SalesExtraDaily.product_id, db.func.sum(SalesExtraDaily.quantity).label('quantity')
+    ).where(SalesExtraDaily.day.between(start, end)).group_by(SalesExtraDaily.product_id).cte('extras')
+
+    top_day = db.select(daily.c.day, daily.c.total_sales).where(daily.c.order_count > 0) \
+        .order_by(daily.c.total_sales.desc()).limit(1).subquery()
+    top_hour = db.select(hourly).order_by(hourly.c.total_sales.desc()).limit(1).subquery()
+    top_product = db.select(products).order_by(products.c.quantity.desc()).limit(1).subquery()
+    top_extra = db.select(extras).order_by(extras.c.quantity.desc()).limit(1).subquery()
+
+    row = db.session.execute(db.select(
+        db.select(db.func.coalesce(db.func.sum(daily.c.total_sales), 0.0)).scalar_subquery().label('total_sales'),
+        db.select(db.func.coalesce(db.func.sum(daily.c.order_count), 0)).scalar_subquery().label('total_orders'),
+        db.select(db.func.coalesce(db.func.sum(daily.c.order_count + daily.c.cancelled_count), 0)).scalar_subquery().label('changes'),
+        db.select(top_day.c.day).scalar_subquery().label('top_day'),
+        db.select(top_day.c.total_sales).scalar_subquery().label('top_day_sales'),
+        db.select(top_hour.c.hour).scalar_subquery().label('top_hour'),
+        db.select(top_hour.c.total_sales).scalar_subquery().label('top_hour_sales'),
+        db.select(top_product.c.product_id).scalar_subquery().label('top_product_id'),
+        db.select(top_product.c.quantity).scalar_subquery().label('top_product_quantity'),
+        db.select(top_extra.c.product_id).scalar_subquery().label('top_extra_id'),
+        db.select(top_extra.c.quantity).scalar_subquery().label('top_extra_quantity')
+    )).one()
+
+    products_by_id = get_catalog()['by_id']
+    def product_name(product_id):
+        product = products_by_id.get(product_id)
+        return product['name'] if product else 'N/A'
+
+    return row.changes, {
+        'total_sales': row.total_sales,
+        'total_orders': row.total_orders,
+        'top_product': (product_name(row.top_product_id), int(row.top_product_quantity)) if row.top_product_id is not None else None,
+        'top_extra': (product_name(row.top_extra_id), int(row.top_extra_quantity)) if row.top_extra_id is not None else None,
+        'top_day': (row.top_day, row.top_day_sales) if row.top_day is not None else None,
+        'top_hour': (row.top_hour, row.top_hour_sales) if row.top_hour is not None else None
+    }
+
+
+def sales_summary(period, start, end, today):
+    """
+    Sales metrics of the local days start..end (inclusive): total_sales,
+    total_orders, top_product (name, quantity), top_extra (name, units),
+    top_day (date, total) and top_hour (hour, total), None when there were
+    no sales.
+
+    Cached per (period, start, end). A closed period is served from memory
+    without touching the database; the current one costs a single aggregate
+    over its rollup rows to check that no order was paid or cancelled since.
+    """
+    key = (period, start, end)
+    cached = _report_cache.get(key)
+    closed = end < today - timedelta(days=1)
+    if cached is not None and (closed or cached['changes'] == _period_changes(start, end)):
+        return cached['summary']
+
+    changes, summary = _query_period_summary(start, end)
+    if len(_report_cache) >= _REPORT_CACHE_SIZE:
+        _report_cache.pop(next(iter(_report_cache)))
+    _report_cache[key] = {'changes': changes, 'summary': summary}
+    return summary
+
+
+def daily_report_orders(start_utc, end_utc):
+    """
+    Rows of the daily report detail for orders paid or cancelled in
+    [start_utc, end_utc]: one flat query over orders, lines, products and
+    parents, grouped here into one dict per order with its cells already
+    formatted, so the PDF only lays them out.
+    """
+    ParentProduct = aliased(Product)
+    rows = db.session.execute(db.select(
+        Order.id, Order.created_at, Order.total, Order.status,
+        OrderItem.quantity, Product.name.label('product_name'), ParentProduct.name.label('parent_name')
+    ).select_from(Order)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .outerjoin(ParentProduct, ParentProduct.id == Product.parent_id)
+        .where(Order.created_at.between(start_utc, end_utc), Order.status.in_(['paid', 'cancelled']))
+        .order_by(Order.created_at, Order.id, OrderItem.id))
+
+    orders_data = []
+    for _, order_rows in groupby(rows, key=lambda row: row.id):
+        order_rows = list(order_rows)
+        first = order_rows[0]
+        item_names = []
+        for row in order_rows:
+            if row.quantity is None:
+                continue
+            product_name = row.product_name
+            if row.parent_name:
+                product_name = f"{row.parent_name} ({product_name})"
+            item_names.append(f"{row.quantity}x {product_name}")
+        orders_data.append({
+            'id': first.id,
+            'time': local_datetime(first.created_at).strftime('%H:%M:%S'),
+            'total': f"Q{first.total:.2f}",
+            'status': first.status,
+            'items': ", ".join(item_names)
+        })
+    return orders_data
@@ -0,0 +1,110 @@
+from app import db
+from app.models import Order, SalesDaily, SalesHourly, SalesProductDaily, SalesExtraDaily
+from app.services.catalog_service import get_catalog
+from app.services.db_utils import upsert_increment
+from app.services.order_service import order_graph_options
+from zoneinfo import ZoneInfo
+
+LOCAL_TZ = ZoneInfo('America/Guatemala')
+UTC = ZoneInfo('UTC')
+
+
+def local_datetime(dt):
+    """Guatemala time of a stored timestamp (naive values are UTC)."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=UTC)
+    return dt.astimezone(LOCAL_TZ)
+
+
+def _product_units(order_items):
+    """{base_product_id: units} sold by the order lines, as the reports count them."""
+    products = get_catalog()['by_id']
+    units = {}
+    for item in order_items:
+        product = products.get(item.product_id)
+        if product is None:
+            continue
+        base_id = product['parent_id'] or product['id']
+        units[base_id] = units.get(base_id, 0) + item.quantity * product['stock_consumption']
+    return units
+
+
+def _extra_units(order_items):
+    """{extra_product_id: units} added to the order lines (per unit of each line)."""
+    units = {}
+    for item in order_items:
+        for extra in item.extras:
+            units[extra.extra_product_id] = units.get(extra.extra_product_id, 0) + extra.quantity * item.quantity
+    return units
+
+
+def record_payment(order):
+    """
+    Adds a paid order to the rollups. Call it inside the transaction that
+    marks the order as paid so both commit or roll back together.
+    """
+    created_at = local_datetime(order.created_at)
+    day = created_at.date()
+    upsert_increment(SalesDaily, {'day': day}, {'total_sales': order.total, 'order_count': 1})
+    upsert_increment(SalesHourly, {'day': day, 'hour': created_at.hour}, {'total_sales': order.total, 'order_count': 1})
+    for product_id, quantity in _product_units(order.items).items():
+        upsert_increment(SalesProductDaily, {'day': day, 'product_id': product_id}, {'quantity': quantity})
+    for product_id, quantity in _extra_units(order.items).items():
+        upsert_increment(SalesExtraDaily, {'day': day, 'product_id': product_id}, {'quantity': quantity})
+
+
+def record_cancellation(order):
+    """Counts a cancelled order on its day, inside the cancelling transaction."""
+    day = local_datetime(order.created_at).date()
+    upsert_increment(SalesDaily, {'day': day}, {'cancelled_count': 1})
+
+
+def rebuild_sales_rollups():
+    """
+    Regenerates every rollup row from order history, e.g. after deploying the
+    rollup tables or fixing data by hand. Runs in the caller's transaction.
+    Returns the number of orders replayed.
+    """
+    SalesExtraDaily.query.delete()
+    SalesProductDaily.query.delete()
+    SalesHourly.query.delete()
+    SalesDaily.query.delete()
+
+    daily, hourly, product_daily, extra_daily = {}, {}, {}, {}
+    orders = Order.query.filter(Order.status.in_(['paid', 'cancelled'])) \
+        .options(*order_graph_options(waiter=False)).order_by(Order.id)
+    replayed = 0
+    for order in orders.yield_per(500):
+        created_at = local_datetime(order.created_at)
+        day = created_at.date()
+        day_row = daily.setdefault(day, {'total_sales': 0.0, 'order_count': 0, 'cancelled_count': 0})
+        replayed += 1
+        if order.status == 'cancelled':
+            day_row['cancelled_count'] += 1
+            continue
+        day_row['total_sales'] += order.total or 0
+        day_row['order_count'] += 1
+        hour_row = hourly.setdefault((day, created_at.hour), {'total_sales': 0.0, 'order_count': 0})
+        hour_row['total_sales'] += order.total or 0
+        hour_row['order_count'] += 1
+        for product_id, quantity in _product_units(order.items).items():
+            product_daily[(day, product_id)] = product_daily.get((day, product_id), 0) + quantity
+        for product_id, quantity in _extra_units(order.items).items():
+            extra_daily[(day, product_id)] = extra_daily.get((day, product_id), 0) + quantity
+
+    db.session.add_all(SalesDaily(day=day, **values) for day, values in daily.items())
+    db.session.add_all(SalesHourly(day=day, hour=hour, **values) for (day, hour), values in hourly.items())
+    db.session.add_all(SalesProductDaily(day=day, product_id=product_id, quantity=quantity)
+                       for (day, product_id), quantity in product_daily.items())
+    db.session.add_all(SalesExtraDaily(day=day, product_id=product_id, quantity=quantity)
+                       for (day, product_id), quantity in extra_daily.items())
+    return replayed
+
+
+def day_totals(day):
+    """(total_sales, order_count) of paid orders for a Guatemala-local day."""
+    row = db.session.get(SalesDaily, day)
+    if row is None:
+        return 0.0, 0
+    return row.total_sales, row.order_count
+
@@ -0,0 +1,118 @@
+from app import db, socketio
+from app.models import Product
+from app.services.metrics_service import record_emit
+from sqlalchemy import event
+
+_PENDING_KEY = 'pending_stock_updates'
+
+
+class InsufficientStockError(Exception):
+    """Raised when an order asks for more stock than is available.
+
+    `shortages` is a list of dicts with product_id, name, requested and
+    available for every product that could not be decremented.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('; '.join(
+            f"Stock insuficiente para {s['name']}. Pedido: {s['requested']}, Disponible: {s['available']}"
+            for s in shortages
+        ))
+
+
+def decrement_stock(stock_requirements):
+    """
+    Atomically takes stock for an order.
+
+    Each product is updated with a single conditional statement
+    (UPDATE product SET stock = stock - n WHERE id = :id AND stock >= n), so two
+    concurrent orders can never both take the last units. Rows are touched in
+    ascending id order so concurrent transactions lock them in the same order
+    and cannot deadlock. The row locks are held until the caller commits or
+    rolls back.
+
+    Returns a dict mapping product id to its new stock. Raises
+    InsufficientStockError listing every short product; the caller must roll
+    back the session in that case, as some rows may already be decremented.
+    """
+    new_stock = {}
+    short_ids = []
+    for product_id in sorted(stock_requirements):
+        units = stock_requirements[product_id]
+        row = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id, Product.stock >= units)
+            .values(stock=Product.stock - units)
+            .returning(Product.stock),
+            execution_options={'synchronize_session': False}
+        ).first()
+        if row is None:
+            short_ids.append(product_id)
+        else:
+            new_stock[product_id] = row.stock
+    queue_stock_updates(new_stock)
+
+    if short_ids:
+        found = {p.id: p for p in Product.query.filter(Product.id.in_(short_ids)).all()}
+        raise InsufficientStockError([
+            {
+                'product_id': product_id,
+                'name': found[product_id].name if product_id in found else 'producto',
+                'requested': stock_requirements[product_id],
+                'available': found[product_id].stock if product_id in found else 0
+            }
+            for product_id in short_ids
+        ])
+
+    return new_stock
+
+
+def restore_stock(stock_requirements):
+    """
+    Atomically gives stock back (UPDATE product SET stock = stock + n), in
+    ascending id order. Returns a dict mapping product id to its new stock;
+    ids that no longer exist are skipped.
+    """
+    new_stock = {}
+    for product_id in sorted(stock_requirements):
+        row = db.session.execute(
+            db.update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + stock_requirements[product_id])
+            .returning(Product.stock),
+            execution_options={'synchronize_session': False}
+        ).first()
+        if row is not None:
+            new_stock[product_id] = row.stock
+    queue_stock_updates(new_stock)
+    return new_stock
+
+
+def queue_stock_updates(new_stock):
+    """
+    Buffers stock changes ({product_id: stock}) on the current transaction.
+    They are broadcast as a single stock_update event once it commits and
+    dropped if it rolls back, so clients never see stock that was not saved.
+    """
+    db.session().info.setdefault(_PENDING_KEY, {}).update(new_stock)
+
+
+def _broadcast_stock_updates(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        socketio.emit('stock_update', {
+            'products': [{'product_id': product_id, 'stock': stock} for product_id, stock in pending.items()]
+        })
+        record_emit('stock_update')
+
+
+def _discard_stock_updates(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_stock_broadcasts():
+    """Hooks the stock_update buffer to the session's commit and rollback."""
+    if not event.contains(db.session, 'after_commit', _broadcast_stock_updates):
+        event.listen(db.session, 'after_commit', _broadcast_stock_updates)
+        event.listen(db.session, 'after_rollback', _discard_stock_updates)
@@ -1,24 +1,44 @@
+from flask import request
 from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
+from app.sockets.room_events import room_for_role, missed_events
+from app.services.metrics_service import client_connected, client_disconnected
 
 def register_socket_events(socketio):
     
     @socketio.on('connect')
     def on_connect():
+        room = None
         if current_user.is_authenticated:
-            if current_user.role == 'cook':
-                join_room('kitchen')
-            elif current_user.role == 'waiter':
-                join_room('waiters')
-            elif current_user.role == 'admin':
-                join_room('admin')
+            room = room_for_role(current_user.role)
+            if room:
+                join_room(room)
+        client_connected(request.sid, room)
     
     @socketio.on('disconnect')
     def on_disconnect():
+        client_disconnected(request.sid)
         if current_user.is_authenticated:
-            if current_user.role == 'cook':
-                leave_room('kitchen')
-            elif current_user.role == 'waiter':
-                leave_room('waiters')
-            elif current_user.role == 'admin':
-                leave_room('admin')
+            room = room_for_role(current_user.role)
+            if room:
+                leave_room(room)
+
+    @socketio.on('resync')
+    def on_resync(data):
+        # Sent by clients on every (re)connect with the last sequence they saw
+        if not current_user.is_authenticated:
+            return
+        room = room_for_role(current_user.role)
+        if not room:
+            return
+        try:
+            epoch, last_seq = data.get('epoch'), int(data.get('seq'))
+        except (AttributeError, TypeError, ValueError):
+            emit('resync_required')
+            return
+        events = missed_events(room, epoch, last_seq)
+        if events is None:
+            emit('resync_required')
+            return
+        for event, payload in events:
+            emit(event, payload)
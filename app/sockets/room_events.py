@@ -0,0 +1,233 @@
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from uuid import uuid4
+from flask import current_app, g
+from app import socketio
+from app.services.metrics_service import record_emit
+import json
+import logging
+import redis
+import time
+
+# Room each role joins on connect
+ROLE_ROOMS = {
+    'cook': 'kitchen',
+    'waiter': 'waiters',
+    'admin': 'admin'
+}
+
+# Identifies this process' sequence space. Sequences are per process, so a
+# client that reconnects to another worker (or after a restart) sees a
+# different epoch and falls back to a full snapshot. With a Redis message
+# queue every worker shares the sequences, buffers and epoch kept in Redis.
+EPOCH = uuid4().hex
+
+_rooms = {}
+_lock = Lock()
+
+_REDIS_PREFIX = 'ms:socket'
+_REDIS_LOCK_TIMEOUT = 10
+_redis_client = None
+_redis_epoch_value = None
+
+
+def _room_log(room):
+    log = _rooms.get(room)
+    if log is None:
+        log = {'seq': 0, 'events': deque(maxlen=current_app.config['SOCKETIO_REPLAY_BUFFER_SIZE'])}
+        _rooms[room] = log
+    return log
+
+
+def room_for_role(role):
+    return ROLE_ROOMS.get(role)
+
+
+def _shared_redis():
+    # With a Redis message queue, the Redis that keeps the rooms' sequences
+    # and buffers for every worker; None without a queue
+    global _redis_client
+    url = current_app.config['SOCKETIO_MESSAGE_QUEUE']
+    if not url or not url.startswith(('redis://', 'rediss://', 'unix://')):
+        return None
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(url)
+    return _redis_client
+
+
+def _redis_keys(room):
+    return f'{_REDIS_PREFIX}:{room}:seq', f'{_REDIS_PREFIX}:{room}:events'
+
+
+def _queue_redis_epoch(pipe):
+    # Created by the first worker that needs it; a Redis that lost its data
+    # (and with it every sequence) gets a new one. Adds two results.
+    pipe.set(f'{_REDIS_PREFIX}:epoch', uuid4().hex, nx=True)
+    pipe.get(f'{_REDIS_PREFIX}:epoch')
+
+
+def _redis_epoch(client):
+    # Read from Redis once per process; every emit refreshes it. A stale copy
+    # (Redis lost its data) only makes pages rendered meanwhile reload on
+    # their next reconnect.
+    global _redis_epoch_value
+    if _redis_epoch_value is None:
+        pipe = client.pipeline(transaction=False)
+        _queue_redis_epoch(pipe)
+        _redis_epoch_value = pipe.execute()[1].decode()
+    return _redis_epoch_value
+
+
+@contextmanager
+def _redis_room_lock(client, room):
+    # A room's lock shared by every worker (SET NX with an expiry, so a
+    # worker that dies holding it cannot block the room for long)
+    key = f'{_REDIS_PREFIX}:{room}:lock'
+    token = uuid4().hex
+    deadline = time.monotonic() + _REDIS_LOCK_TIMEOUT
+    while not client.set(key, token, nx=True, px=_REDIS_LOCK_TIMEOUT * 1000):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Sala {room} bloqueada en Redis')
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        # Release only our own lock, not one taken after ours expired
+        if client.get(key) == token.encode():
+            client.delete(key)
+
+
+def replay_enabled():
+    # With a message queue other than Redis, other workers emit into the same
+    # rooms and their events are not in this process' buffer: only a
+    # snapshot is safe.
+    queue = current_app.config['SOCKETIO_MESSAGE_QUEUE']
+    return not queue or _shared_redis() is not None
+
+
+def sync_state(room):
+    """
+    Returns the {epoch, seq} a freshly rendered page for `room` starts from,
+    or None when replay is not available and reconnects must reload instead.
+    """
+    if not replay_enabled():
+        return None
+    client = _shared_redis()
+    if client is not None:
+        seq_key, _ = _redis_keys(room)
+        return {'epoch': _redis_epoch(client), 'seq': int(client.get(seq_key) or 0)}
+    with _lock:
+        seq = _room_log(room)['seq']
+    return {'epoch': EPOCH, 'seq': seq}
+
+
+def capture_sync_state(room):
+    """
+    Takes the sync state of a live board page before its orders are queried
+    (see the socket_sync context processor). An event emitted while the page
+    is being built is then replayed on connect instead of lost; the client
+    skips what the page already shows.
+    """
+    g.socket_sync = sync_state(room)
+
+
+def emit_to_room(event, data, room):
+    """
+    Emits `event` to `room` stamped with the room's next sequence number and
+    keeps it in the room's bounded replay buffer, so clients that drop off for
+    a moment can ask for exactly what they missed.
+
+    With Redis it raises redis.RedisError, or TimeoutError when the room's
+    lock cannot be taken; see request_reload().
+    """
+    client = _shared_redis()
+    if client is not None:
+        _emit_through_redis(client, event, data, room)
+    else:
+        with _lock:
+            log = _room_log(room)
+            log['seq'] += 1
+            payload = dict(data, seq=log['seq'], epoch=EPOCH)
+            log['events'].append((log['seq'], event, payload))
+            # Emit under the lock so clients always receive a room's events in sequence order
+            socketio.emit(event, payload, room=room)
+    record_emit(event, room)
+
+
+def _emit_through_redis(client, event, data, room):
+    global _redis_epoch_value
+    seq_key, events_key = _redis_keys(room)
+    # The sequence is taken and the event published under the room's lock,
+    # so clients receive a room's events in sequence order whatever worker
+    # emitted them
+    with _redis_room_lock(client, room):
+        pipe = client.pipeline(transaction=False)
+        _queue_redis_epoch(pipe)
+        pipe.incr(seq_key)
+        _, epoch, seq = pipe.execute()
+        epoch = _redis_epoch_value = epoch.decode()
+        payload = dict(data, seq=seq, epoch=epoch)
+        pipe = client.pipeline(transaction=False)
+        pipe.lpush(events_key, json.dumps([seq, event, payload]))
+        pipe.ltrim(events_key, 0, current_app.config['SOCKETIO_REPLAY_BUFFER_SIZE'] - 1)
+        pipe.execute()
+        socketio.emit(event, payload, room=room)
+
+
+def request_reload(room):
+    """
+    Asks the clients of `room` to reload their board (resync_required) after
+    one of its events could not be emitted. Best effort: if the message queue
+    is down too, clients still find the gap in the sequence on the next event
+    or reconnect.
+    """
+    try:
+        socketio.emit('resync_required', room=room)
+    except Exception:
+        logging.exception(f"[SOCKET] No se pudo pedir la recarga de la sala {room}")
+
+
+def missed_events(room, epoch, last_seq):
+    """
+    Returns the buffered (event, payload) pairs after `last_seq`, or None when
+    they cannot be replayed (other epoch, or the gap is older than the buffer)
+    and the client has to reload a snapshot instead.
+    """
+    if not replay_enabled():
+        return None
+    client = _shared_redis()
+    if client is not None:
+        return _redis_missed_events(client, room, epoch, last_seq)
+    with _lock:
+        log = _room_log(room)
+        if epoch != EPOCH or last_seq > log['seq']:
+            return None
+        if last_seq == log['seq']:
+            return []
+        oldest_seq = log['events'][0][0] if log['events'] else log['seq'] + 1
+        if last_seq + 1 < oldest_seq:
+            return None
+        return [(event, payload) for seq, event, payload in log['events'] if seq > last_seq]
+
+
+def _redis_missed_events(client, room, epoch, last_seq):
+    seq_key, events_key = _redis_keys(room)
+    pipe = client.pipeline()
+    pipe.get(f'{_REDIS_PREFIX}:epoch')
+    pipe.get(seq_key)
+    pipe.lrange(events_key, 0, -1)
+    current_epoch, seq, buffered = pipe.execute()
+    seq = int(seq or 0)
+    if current_epoch is None or epoch != current_epoch.decode() or last_seq > seq:
+        return None
+    if last_seq == seq:
+        return []
+    # Newest first in Redis
+    missed = [(event_seq, event, payload) for event_seq, event, payload in map(json.loads, reversed(buffered))
+              if event_seq > last_seq]
+    # Older than the buffer, or an event whose sequence was taken but that
+    # never made it into the buffer (Redis failed mid-emit)
+    if [event_seq for event_seq, _, _ in missed] != list(range(last_seq + 1, seq + 1)):
+        return None
+    return [(event, payload) for _, event, payload in missed]
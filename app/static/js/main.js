@@ -77,12 +77,48 @@ function playNotificationSound() {
 
 // --- WebSocket Connection and Event Handlers ---
 if (typeof io !== "undefined") {
-  const socket = io({ path: '/socket.io/' });
+  // With several workers only WebSocket works: polling needs sticky sessions
+  const socket = io({ path: '/socket.io/', transports: SOCKETIO_TRANSPORTS });
+
+  // Last room event this page has applied ({epoch, seq}); sent on every
+  // (re)connect so the server replays only what was missed
+  let socketSync = SOCKET_SYNC;
 
   socket.on("connect", () => {
     console.log("Connected to WebSocket server");
+    if (socketSync) {
+      socket.emit('resync', socketSync);
+    }
   });
 
+  // Without replay (several workers), a reconnect reloads the live boards
+  socket.io.on("reconnect", () => {
+    if (!socketSync) reloadLiveBoard();
+  });
+
+  // Too many events were missed to replay them
+  socket.on('resync_required', reloadLiveBoard);
+
+  function reloadLiveBoard() {
+    if (document.querySelector('[data-live-board]')) {
+      window.location.reload();
+    }
+  }
+
+  // Room events carry a sequence number; skip the ones already applied
+  function isNewRoomEvent(data) {
+    if (!socketSync || data.seq === undefined) return true;
+    if (data.epoch === socketSync.epoch && data.seq <= socketSync.seq) return false;
+    // An event was lost on the way (e.g. the server failed to emit it): ask
+    // for everything after the last one applied, which includes this one
+    if (data.epoch === socketSync.epoch && data.seq > socketSync.seq + 1) {
+      socket.emit('resync', socketSync);
+      return false;
+    }
+    socketSync = { epoch: data.epoch, seq: data.seq };
+    return true;
+  }
+
   socket.on("disconnect", () => {
     console.log("Disconnected from WebSocket server");
   });
@@ -90,6 +126,9 @@ if (typeof io !== "undefined") {
   // --- Event Handlers ---
 
   socket.on('new_order', (data) => {
+    if (!isNewRoomEvent(data)) return;
+    // A replayed order the page already showed when it was rendered
+    if (document.getElementById(`order-card-${data.order_id}`)) return;
     const ordersContainer = document.getElementById('orders-container');
     if (ordersContainer) {
         showNotification(`Nueva orden #${data.order_id} para ${data.customer_name}`, 'info');
@@ -102,6 +141,7 @@ if (typeof io !== "undefined") {
   });
 
   socket.on('order_status_update', (data) => {
+    if (!isNewRoomEvent(data)) return;
     const message = `La orden #${data.order_id} (${data.customer_name}) está ${data.status.replace(/_/g, ' ')}.`;
     showNotification(message, 'success');
     
@@ -112,7 +152,16 @@ if (typeof io !== "undefined") {
     updateCookOrderStatus(data.order_id, data.status);
   });
 
+  // Stock changes arrive batched: one event per committed transaction
   socket.on('stock_update', (data) => {
+    data.products.forEach(update => applyStockUpdate(update));
+  });
+
+}
+
+// --- UI Update Functions ---
+
+function applyStockUpdate(data) {
     // Update stock on "Take Order" page
     const productCard = document.querySelector(`.product-card[data-product-id="${data.product_id}"]`);
     if (productCard) {
@@ -143,22 +192,12 @@ if (typeof io !== "undefined") {
             stockSpan.className = `badge fs-6 stock-level bg-${data.stock == 0 ? 'danger' : data.stock <= 5 ? 'warning' : 'success'}`;
         }
     }
-  });
-
 }
 
-// --- UI Update Functions ---
-
 function createNewOrderCard(data) {
     let itemsHtml = '';
     data.items.forEach(item => {
-        let extrasText = '';
-        if (item.extras && item.extras !== '[]') {
-            try {
-                const extrasList = JSON.parse(item.extras);
-                extrasText = extrasList.map(e => `${e.name} (x${e.quantity})`).join(', ');
-            } catch(e) { extrasText = item.extras; } // Fallback for non-json
-        }
+        const extrasText = (item.extras || []).map(e => `${e.name} (x${e.quantity})`).join(', ');
 
         itemsHtml += `
             <div class="mb-2">
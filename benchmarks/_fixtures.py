@@ -0,0 +1,148 @@
+"""
+Setup shared by the benchmarks and checks: a throwaway database, the app and
+the seed data (users, a menu like the restaurant's, orders in any status).
+
+use_database() sets the environment the app reads at import time, so it runs
+before anything is imported from `app`:
+
+    from _fixtures import use_database
+    use_database('budgets')
+
+    from _fixtures import PASSWORD, create_test_app, seed_users, seed_menu, seed_orders
+
+The seed functions run inside an app context.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'bench'
+STATUSES = ['pending', 'sent_to_kitchen', 'in_preparation', 'ready', 'paid', 'cancelled']
+
+
+def use_database(name, url_env=None):
+    """
+    Points the app at a new SQLite file named after the script, or at the
+    database in the `url_env` environment variable when it is set (it must be
+    EMPTY: tables are created and rows seeded). PDFs are cached in a new
+    directory too, so a receipt is never served from an earlier run.
+    """
+    if url_env and os.environ.get(url_env):
+        os.environ['DATABASE_URL'] = os.environ[url_env]
+    else:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), f'{name}.db')}"
+    os.environ['PDF_CACHE_DIR'] = tempfile.mkdtemp()
+    os.environ.setdefault('DEFAULT_ADMIN_PASSWORD', PASSWORD)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def create_test_app():
+    """The app with its tables and indexes created (init-db) and CSRF off."""
+    from app import create_app
+    from app.commands import init_db
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        init_db()
+    return app
+
+
+def seed_users(users):
+    """
+    Creates {username: role} users, all with PASSWORD, and returns
+    {username: id}. They share one hash so seeding many users does not cost
+    a PBKDF2 run each.
+    """
+    from app import db
+    from app.models import User
+    from app.services.password_service import hash_password
+    password_hash = hash_password(PASSWORD)
+    rows = [User(username=username, password_hash=password_hash, role=role, full_name=username.capitalize())
+            for username, role in users.items()]
+    db.session.add_all(rows)
+    db.session.commit()
+    return {user.username: user.id for user in rows}
+
+
+def seed_menu(label=''):
+    """
+    Two base products with variants, drinks, extras and two combos. `label`
+    is appended to every base name, so a script can seed more copies to grow
+    the catalog. Returns the ids by kind; 'sellables' are what an order line
+    can hold (variants, drinks and combos).
+    """
+    from app import db
+    from app.models import Product, ComboItem
+    chicken = Product(name=f'Pollo{label}', category='Principal', stock=10**7)
+    burger = Product(name=f'Hamburguesa{label}', category='Principal', stock=10**7)
+    drinks = [Product(name=f'{name}{label}', category='Bebida', price=price, stock=10**7)
+              for name, price in [('Gaseosa', 8), ('Agua', 5), ('Café', 10), ('Limonada', 12)]]
+    extras = [Product(name=f'{name}{label}', category='Extra', price=price, stock=10**7)
+              for name, price in [('Queso', 5), ('Tocino', 8), ('Papas', 10), ('Salsa', 2)]]
+    db.session.add_all([chicken, burger] + drinks + extras)
+    db.session.flush()
+    variants = [Product(name=name, category='Principal', price=price, parent_id=chicken.id, stock_consumption=consumption)
+                for name, price, consumption in [('Pieza', 15, 1), ('Medio', 55, 4), ('Entero', 100, 8)]]
+    variants += [Product(name=name, category='Principal', price=price, parent_id=burger.id, stock_consumption=consumption)
+                 for name, price, consumption in [('Sencilla', 35, 1), ('Doble', 50, 2)]]
+    combos = [Product(name=f'Combo Familiar{label}', category='Combo', price=150, stock=999),
+              Product(name=f'Combo Personal{label}', category='Combo', price=45, stock=999)]
+    db.session.add_all(variants + combos)
+    db.session.flush()
+    db.session.add_all([
+        ComboItem(combo_product_id=combos[0].id, component_product_id=chicken.id, quantity=8),
+        ComboItem(combo_product_id=combos[0].id, component_product_id=drinks[0].id, quantity=4),
+        ComboItem(combo_product_id=combos[1].id, component_product_id=burger.id, quantity=1),
+        ComboItem(combo_product_id=combos[1].id, component_product_id=drinks[0].id, quantity=1),
+    ])
+    db.session.commit()
+    return {
+        'bases': [chicken.id, burger.id],
+        'variants': [p.id for p in variants],
+        'drinks': [p.id for p in drinks],
+        'extras': [p.id for p in extras],
+        'combos': [p.id for p in combos],
+        'sellables': [p.id for p in variants + drinks + combos],
+    }
+
+
+def add_order(waiter_id, menu, status, n=0, created_at=None, updated_at=None):
+    """
+    Adds (and flushes) a three-line order: two of a variant with an extra, a
+    drink with notes and a combo. `n` picks the variant and customer name.
+    """
+    from app import db
+    from app.models import Order, OrderItem, OrderItemExtra
+    order = Order(customer_name=f'Cliente {n}', status=status, total=203, waiter_id=waiter_id,
+                  created_at=created_at or datetime.utcnow(), updated_at=updated_at,
+                  cash_received=250, change_given=47)
+    order.items = [
+        OrderItem(product_id=menu['variants'][n % len(menu['variants'])], quantity=2, unit_price=20,
+                  extras=[OrderItemExtra(extra_product_id=menu['extras'][0], quantity=1, unit_price=5)]),
+        OrderItem(product_id=menu['drinks'][0], quantity=1, unit_price=8, notes='Sin hielo'),
+        OrderItem(product_id=menu['combos'][0], quantity=1, unit_price=150),
+    ]
+    db.session.add(order)
+    db.session.flush()
+    return order.id
+
+
+def seed_orders(waiter_ids, menu, count, statuses=STATUSES, spacing=timedelta(minutes=1), updated_after=None):
+    """
+    `count` orders cycling through `statuses` and `waiter_ids`, each one
+    `spacing` older than the previous one and, with `updated_after`, last
+    changed that long after it was created. Returns their ids.
+    """
+    from app import db
+    now = datetime.utcnow()
+    ids = []
+    for n in range(count):
+        created_at = now - spacing * n
+        updated_at = created_at + updated_after if updated_after is not None else None
+        ids.append(add_order(waiter_ids[n % len(waiter_ids)], menu, statuses[n % len(statuses)], n, created_at, updated_at))
+    db.session.commit()
+    return ids
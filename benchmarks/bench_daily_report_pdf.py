@@ -0,0 +1,59 @@
+"""
+Measures the daily-close PDF build as the number of orders grows.
+
+Renders generate_daily_report_pdf() from synthetic rows (no database) and
+prints the build time, peak memory and time per order:
+
+    python benchmarks/bench_daily_report_pdf.py
+
+Time and memory per order should stay roughly flat from 100 to 2000 orders;
+a per-order time that keeps climbing means the detail table is being
+re-measured on every page split again.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.report_pdf import generate_daily_report_pdf
+
+SIZES = (100, 500, 1000, 2000)
+
+
+def orders_data(count):
+    rows = []
+    for n in range(count):
+        items = ', '.join(f"{k + 1}x Pollo (Porción {k + 1})" for k in range(1 + n % 6))
+        rows.append({
+            'id': n + 1,
+            'time': f"{8 + n * 12 // count:02d}:{n % 60:02d}:00",
+            'total': f"Q{30 + n % 50:.2f}",
+            'status': 'cancelled' if n % 10 == 0 else 'paid',
+            'items': items
+        })
+    return rows
+
+
+def main():
+    print(f"{'orders':>6}  {'seconds':>8}  {'ms/order':>8}  {'peak MB':>8}  {'KB/order':>8}")
+    for count in SIZES:
+        context = {
+            'cash_in_register': 1000.0, 'difference': 0.0, 'total_sales': 1000.0,
+            'report_date_str': 'Sábado, 18 de Octubre de 2026',
+            'orders_data': orders_data(count)
+        }
+        start = time.perf_counter()
+        generate_daily_report_pdf(context)
+        elapsed = time.perf_counter() - start
+        # Second build for memory: tracemalloc slows the build several times
+        tracemalloc.start()
+        generate_daily_report_pdf(context)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{count:>6}  {elapsed:>8.2f}  {elapsed * 1000 / count:>8.2f}  {peak / 2**20:>8.1f}  {peak / 1024 / count:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
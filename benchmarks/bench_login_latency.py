@@ -0,0 +1,112 @@
+"""
+Measures socket latency on the eventlet hub while a burst of logins runs.
+
+A green echo server and client exchange a ping every 10 ms. The client
+records the round trip first on an idle hub, then during a burst of
+concurrent logins. It runs the burst twice: once with password hashing
+inline on the hub (how it used to run) and once through eventlet.tpool
+(password_service):
+
+    python benchmarks/bench_login_latency.py
+
+With tpool the pings keep flowing and their latency stays in the
+milliseconds. Inline, every PBKDF2 verification freezes the hub: the pings
+stop and the longest stall (time between two pings beyond the 10 ms
+interval) grows to about the time the whole burst takes.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import time
+
+from _fixtures import use_database
+use_database('bench', url_env='DATABASE_URL')
+
+from eventlet import tpool
+from _fixtures import PASSWORD, create_test_app, seed_users
+from app.services import password_service
+
+LOGINS = 20
+PING_INTERVAL = 0.01
+
+
+def echo(conn):
+    while True:
+        data = conn.recv(64)
+        if not data:
+            return
+        conn.sendall(data)
+
+
+def echo_server(server):
+    while True:
+        conn, _ = server.accept()
+        eventlet.spawn(echo, conn)
+
+
+def ping(address, started, done, samples, stalls):
+    client = eventlet.connect(address)
+    # The first ping only goes out once the hub lets this green thread run
+    last = started
+    while not done.ready():
+        start = time.perf_counter()
+        stalls.append((start - last - PING_INTERVAL) * 1000)
+        client.sendall(b'ping')
+        client.recv(64)
+        last = time.perf_counter()
+        samples.append((last - start) * 1000)
+        eventlet.sleep(PING_INTERVAL)
+    client.close()
+
+
+def login_burst(app, count):
+    def login(n):
+        response = app.test_client().post('/login', data={'username': f'mesero{n}', 'password': PASSWORD})
+        assert response.status_code == 302, response.status_code
+
+    pool = eventlet.GreenPool(count)
+    for n in range(count):
+        pool.spawn(login, n)
+    pool.waitall()
+
+
+def measure(label, address, work):
+    samples, stalls = [], []
+    done = eventlet.Event()
+    start = time.perf_counter()
+    pinger = eventlet.spawn(ping, address, start, done, samples, stalls)
+    if work is None:
+        eventlet.sleep(1)
+    else:
+        work()
+    elapsed = time.perf_counter() - start
+    done.send()
+    pinger.wait()
+    samples.sort()
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<18} {elapsed:>7.2f}  {len(samples):>6}  {p50:>8.2f}  {p99:>8.2f}  {samples[-1]:>8.2f}  {max(stalls):>9.1f}")
+
+
+def main():
+    app = create_test_app()
+    with app.app_context():
+        seed_users({f'mesero{n}': 'waiter' for n in range(LOGINS)})
+
+    server = eventlet.listen(('127.0.0.1', 0))
+    eventlet.spawn(echo_server, server)
+    address = server.getsockname()
+
+    offloaded = password_service._run
+    print(f"{LOGINS} logins, PBKDF2 {app.config['PASSWORD_HASH_ITERATIONS']} iterations")
+    print(f"{'':<18} {'seconds':>7}  {'pings':>6}  {'p50 ms':>8}  {'p99 ms':>8}  {'max ms':>8}  {'stall ms':>9}")
+    measure('idle', address, None)
+    password_service._run = lambda fn, *args: fn(*args)
+    measure('logins, inline', address, lambda: login_burst(app, LOGINS))
+    password_service._run = offloaded
+    measure('logins, tpool', address, lambda: login_burst(app, LOGINS))
+    tpool.killall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Counts the SQL statements of the order pages as the number of orders grows.
+
+Runs against a throwaway SQLite database, reading the per-request count from
+the X-Query-Count header (SQL_QUERY_COUNT_HEADER):
+
+    python benchmarks/bench_order_pages.py
+
+Every page must issue the same number of queries for 10 or 200 orders; the
+script exits with status 1 when a count grows with the order volume (an N+1
+on order.items, item.product, product.parent or order.waiter).
+"""
+import os
+import sys
+from datetime import timedelta
+
+from _fixtures import use_database
+use_database('bench', url_env='DATABASE_URL')
+os.environ['SQL_QUERY_COUNT_HEADER'] = 'true'
+
+from _fixtures import PASSWORD, create_test_app, seed_users, seed_menu, seed_orders
+from app.models import Order
+
+
+def add_orders(count, waiter_id, menu):
+    seed_orders([waiter_id], menu, count, spacing=timedelta(seconds=1))
+    paid = Order.query.filter_by(status='paid').order_by(Order.id.desc()).first()
+    return paid.id
+
+
+def main():
+    app = create_test_app()
+    with app.app_context():
+        waiter_id = seed_users({'mesero': 'waiter', 'cocina': 'cook', 'gerente': 'admin'})['mesero']
+        menu = seed_menu()
+
+    # Requests run outside any app context so each one gets its own flask.g
+    clients = {}
+    for username in ('mesero', 'cocina', 'gerente'):
+        clients[username] = app.test_client()
+        clients[username].post('/login', data={'username': username, 'password': PASSWORD})
+
+    counts = {}
+    total = 0
+    print(f"{'orders':>6}  page")
+    for size in (10, 50, 200):
+        with app.app_context():
+            paid_id = add_orders(size - total, waiter_id, menu)
+        total = size
+        pages = [
+            ('mesero', '/waiter/dashboard?view=all'),
+            ('mesero', f'/waiter/order/{paid_id}'),
+            ('mesero', f'/waiter/receipt/{paid_id}/pdf'),
+            ('cocina', '/cook/dashboard'),
+            ('gerente', '/admin/daily_close'),
+            ('gerente', '/admin/daily_close?download=pdf'),
+        ]
+        for username, path in pages:
+            response = clients[username].get(path)
+            key = path.replace(str(paid_id), '<id>')
+            counts.setdefault(key, []).append(int(response.headers['X-Query-Count']))
+        print(f"{size:>6}  done")
+
+    growing = []
+    for path, values in counts.items():
+        print(f"{path:<40} queries: {' -> '.join(str(v) for v in values)}")
+        if values[-1] > values[0]:
+            growing.append(path)
+    for path in growing:
+        print(f'N+1: {path}')
+    sys.exit(1 if growing else 0)
+
+
+if __name__ == '__main__':
+    main()
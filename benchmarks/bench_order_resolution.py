@@ -0,0 +1,57 @@
+"""
+Counts the SQL statements issued while resolving orders of growing size.
+
+Runs against a throwaway SQLite database, so no Postgres is needed:
+
+    python benchmarks/bench_order_resolution.py
+
+The query count of resolve_order_items must stay flat as the order grows
+(only the catalog version check once the catalog cache is warm).
+"""
+import time
+
+from _fixtures import use_database
+use_database('bench', url_env='DATABASE_URL')
+
+from sqlalchemy import event
+from _fixtures import create_test_app, seed_menu
+from app import db
+from app.services.catalog_service import get_catalog
+from app.services.order_service import resolve_order_items
+
+
+def build_order(size, sellables, extras):
+    items = []
+    for n in range(size):
+        extra = extras[n % len(extras)]
+        items.append({
+            'product_id': sellables[n % len(sellables)],
+            'quantity': 1 + n % 3,
+            'extras': [{'id': extra, 'quantity': 1}],
+            'notes': ''
+        })
+    return items
+
+
+def main():
+    app = create_test_app()
+    with app.app_context():
+        menu = seed_menu()
+        sellables, extras = menu['sellables'], menu['extras']
+        get_catalog()  # warm the catalog cache, as any earlier request would
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+        print(f"{'lines':>6} {'queries':>8} {'ms':>8}")
+        for size in (1, 10, 50, 200):
+            items = build_order(size, sellables, extras)
+            db.session.expunge_all()
+            statements.clear()
+            started = time.perf_counter()
+            resolve_order_items(items)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            print(f"{size:>6} {len(statements):>8} {elapsed_ms:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""
+Checks the SQL statement budget of every admin, waiter and cook route.
+
+Seeds a menu (variants, a combo, extras) and orders in every status, then
+requests each route through the test client counting its statements with
+count_queries() (app/services/query_budget.py). It runs twice: once with a few orders and
+products and again after adding many more. A route fails when:
+
+- it runs more statements than its budget in BUDGETS, or
+- its count grows with the data (an N+1 even if still within budget), or
+- it has no budget declared (every new route must get one).
+
+For each failure the repeated statements are listed with the relationship
+(e.g. `Order.items (lazy)`) or the line of code or template that issued them.
+
+    python benchmarks/check_query_budgets.py
+
+It exits with status 1 on any failure, so it can run in CI. Counts are of
+warm requests: list pages are requested once before being measured, so
+per-process caches (catalog, identity, reports) are filled as in production.
+"""
+import os
+import sys
+from datetime import datetime
+
+from _fixtures import use_database
+use_database('budgets')
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+os.environ['PDF_RENDER_WORKERS'] = '0'
+
+import json
+import logging
+from _fixtures import PASSWORD, create_test_app, seed_users, seed_menu, add_order, seed_orders
+from app import db
+from app.models import Product
+from app.services.query_budget import count_queries
+
+BLUEPRINTS = ('admin', 'waiter', 'cook')
+
+# Most SQL statements each route may run, per (method, endpoint). Writes that
+# touch every product of an order (stock, sales rollups) grow with the order,
+# not with the data; their budgets are for the three-line orders seeded here.
+BUDGETS = {
+    ('GET', 'admin.dashboard'): 2,
+    ('GET', 'admin.menu'): 2,
+    ('POST', 'admin.add_product'): 3,
+    ('POST', 'admin.edit_product'): 5,
+    ('POST', 'admin.add_variant'): 3,
+    ('POST', 'admin.edit_variant'): 3,
+    ('POST', 'admin.delete_variant'): 3,
+    ('POST', 'admin.delete_product'): 3,
+    ('GET', 'admin.users'): 1,
+    ('POST', 'admin.add_user'): 3,
+    ('GET', 'admin.reports'): 1,
+    ('GET', 'admin.export_sales'): 2,
+    ('GET', 'admin.metrics'): 0,
+    ('GET', 'admin.daily_close'): 5,
+    ('POST', 'admin.daily_close'): 3,
+    ('GET', 'waiter.dashboard'): 2,
+    ('GET', 'waiter.orders_api'): 5,
+    ('GET', 'waiter.take_order'): 2,
+    ('POST', 'waiter.create_order'): 10,
+    ('GET', 'waiter.view_order'): 3,
+    ('POST', 'waiter.send_to_kitchen'): 4,
+    ('POST', 'waiter.cancel_order'): 7,
+    ('GET', 'waiter.process_payment'): 3,
+    ('POST', 'waiter.process_payment'): 14,
+    ('GET', 'waiter.receipt_pdf'): 0,
+    ('GET', 'waiter.receipt_ticket'): 3,
+    ('GET', 'cook.dashboard'): 3,
+    ('GET', 'cook.orders_api'): 5,
+    ('POST', 'cook.start_preparation'): 1,
+    ('POST', 'cook.mark_ready'): 1,
+    ('GET', 'cook.stock'): 2,
+}
+
+
+# --- Seed --- #
+
+def seed_more_data(waiter_id, copies, orders):
+    """Grows the catalog by `copies` menus and adds `orders` orders on them."""
+    for n in range(copies):
+        menu = seed_menu(f' {n}')
+    seed_orders([waiter_id], menu, orders)
+
+
+# --- Scenarios --- #
+
+def scenarios(waiter_id, menu):
+    """
+    (method, endpoint, user, setup) per route. setup runs in an app context
+    before the measured request and returns (path, form data); it creates the
+    rows a POST consumes, so each request acts on a fresh one.
+    """
+    today = datetime.utcnow().date().isoformat()
+
+    def fixed(path, data=None):
+        return lambda: (path, data)
+
+    def on_order(status, path, data=None):
+        def setup():
+            order_id = add_order(waiter_id, menu, status)
+            db.session.commit()
+            return path.format(id=order_id), data
+        return setup
+
+    def on_product(path, data, variant=False):
+        def setup():
+            product = Product(name='Temporal', category='Principal', stock=10)
+            db.session.add(product)
+            db.session.flush()
+            if variant:
+                product = Product(name='Variante', category='Principal', price=10, parent_id=product.id)
+                db.session.add(product)
+            db.session.commit()
+            return path.format(id=product.id), data
+        return setup
+
+    items = json.dumps({'product_id': menu['variants'][0], 'quantity': 2, 'extras': [{'id': menu['extras'][0], 'quantity': 1}]})
+    combo_item = json.dumps({'product_id': menu['combos'][0], 'quantity': 1})
+
+    return [
+        ('GET', 'waiter.dashboard', 'mesero', fixed('/waiter/dashboard?view=all')),
+        ('GET', 'waiter.orders_api', 'mesero', fixed('/waiter/api/orders?view=all')),
+        ('GET', 'waiter.take_order', 'mesero', fixed('/waiter/take_order')),
+        ('POST', 'waiter.create_order', 'mesero', fixed('/waiter/create_order', {'customer_name': 'Cliente', 'items': [items, combo_item]})),
+        ('GET', 'waiter.view_order', 'mesero', on_order('pending', '/waiter/order/{id}')),
+        ('POST', 'waiter.send_to_kitchen', 'mesero', on_order('pending', '/waiter/send_to_kitchen/{id}')),
+        ('POST', 'waiter.cancel_order', 'mesero', on_order('sent_to_kitchen', '/waiter/cancel_order/{id}')),
+        ('GET', 'waiter.process_payment', 'mesero', on_order('ready', '/waiter/process_payment/{id}')),
+        ('POST', 'waiter.process_payment', 'mesero', on_order('ready', '/waiter/process_payment/{id}', {'cash_received': '500'})),
+        ('GET', 'waiter.receipt_pdf', 'mesero', on_order('paid', '/waiter/receipt/{id}/pdf')),
+        ('GET', 'waiter.receipt_ticket', 'mesero', on_order('paid', '/waiter/receipt/{id}/ticket')),
+        ('GET', 'cook.dashboard', 'cocina', fixed('/cook/dashboard')),
+        ('GET', 'cook.orders_api', 'cocina', fixed('/cook/api/orders')),
+        ('POST', 'cook.start_preparation', 'cocina', on_order('sent_to_kitchen', '/cook/start_preparation/{id}')),
+        ('POST', 'cook.mark_ready', 'cocina', on_order('in_preparation', '/cook/mark_ready/{id}')),
+        ('GET', 'cook.stock', 'cocina', fixed('/cook/stock')),
+        ('GET', 'admin.dashboard', 'gerente', fixed('/admin/dashboard')),
+        ('GET', 'admin.menu', 'gerente', fixed('/admin/menu')),
+        ('GET', 'admin.users', 'gerente', fixed('/admin/users')),
+        ('GET', 'admin.reports', 'gerente', fixed('/admin/reports?period=weekly')),
+        ('GET', 'admin.export_sales', 'gerente', fixed(f'/admin/export/sales?start={today}&end={today}')),
+        ('GET', 'admin.metrics', 'gerente', fixed('/admin/metrics')),
+        ('GET', 'admin.daily_close', 'gerente', fixed('/admin/daily_close')),
+        ('POST', 'admin.daily_close', 'gerente', fixed('/admin/daily_close', {'cash_in_register': '100'})),
+        ('POST', 'admin.add_user', 'gerente', lambda: ('/admin/add_user', {'username': f'nuevo{datetime.utcnow().timestamp()}', 'password': 'x',
+                                                                          'role': 'waiter', 'full_name': 'Nuevo'})),
+        # Catalog changes last: they invalidate the catalog cache
+        ('POST', 'admin.add_product', 'gerente', fixed('/admin/add_product', {'category': 'Combo', 'name': 'Combo nuevo', 'price': '50', 'stock': '10',
+                                                                                      'component_ids[]': [str(menu['drinks'][0])], 'component_quantities[]': ['2']})),
+        ('POST', 'admin.edit_product', 'gerente', lambda: (f"/admin/edit_product/{menu['combos'][0]}", {'name': 'Combo', 'price': '120',
+                                                                                                    'component_ids[]': [str(menu['drinks'][0])], 'component_quantities[]': ['2']})),
+        ('POST', 'admin.add_variant', 'gerente', on_product('/admin/add_variant/{id}', {'variant_name': 'Nueva', 'variant_price': '10', 'variant_consumption': '1'})),
+        ('POST', 'admin.edit_variant', 'gerente', on_product('/admin/edit_variant/{id}', {'variant_name': 'Editada', 'variant_price': '12', 'variant_consumption': '1'}, variant=True)),
+        ('POST', 'admin.delete_variant', 'gerente', on_product('/admin/delete_variant/{id}', None, variant=True)),
+        ('POST', 'admin.delete_product', 'gerente', on_product('/admin/delete_product/{id}', None)),
+    ]
+
+
+def routes_without_budget(app):
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split('.')[0] not in BLUEPRINTS:
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.endpoint) not in BUDGETS:
+                missing.append(f'{method} {rule.endpoint}')
+    return missing
+
+
+def measure(app, clients, waiter_id, menu):
+    """{(method, endpoint): QueryLog} of one warm request per route."""
+    logs = {}
+    for method, endpoint, username, setup in scenarios(waiter_id, menu):
+        with app.app_context():
+            path, data = setup()
+        client = clients[username]
+        if method == 'GET':
+            client.get(path).get_data()
+        with count_queries() as log:
+            response = client.open(path, method=method, data=data)
+            # Streamed responses (exports) query while they are read
+            response.get_data()
+        if response.status_code >= 400:
+            sys.exit(f'{method} {path} respondió {response.status_code}')
+        logs[(method, endpoint)] = log
+    return logs
+
+
+def main():
+    # The daily close route logs every step at WARNING
+    logging.disable(logging.WARNING)
+    app = create_test_app()
+    with app.app_context():
+        waiter_id = seed_users({'mesero': 'waiter', 'cocina': 'cook', 'gerente': 'admin'})['mesero']
+        menu = seed_menu()
+        seed_orders([waiter_id], menu, 6)
+
+    # Requests run outside any app context: an outer one would be shared by
+    # every request and keep the first logged-in user in flask.g
+    clients = {}
+    for username in ('mesero', 'cocina', 'gerente'):
+        clients[username] = app.test_client()
+        clients[username].post('/login', data={'username': username, 'password': PASSWORD})
+
+    small = measure(app, clients, waiter_id, menu)
+    with app.app_context():
+        seed_more_data(waiter_id, 10, 120)
+    large = measure(app, clients, waiter_id, menu)
+
+    failures = []
+    print(f"{'route':<32} {'small':>5} {'large':>5} {'budget':>6}")
+    for key in sorted(large):
+        budget = BUDGETS.get(key)
+        before, after = small[key].count, large[key].count
+        print(f"{key[0] + ' ' + key[1]:<32} {before:>5} {after:>5} {budget if budget is not None else '-':>6}")
+        problem = None
+        if budget is not None and after > budget:
+            problem = f'{after} sentencias SQL, presupuesto {budget}'
+        elif after > before:
+            problem = f'las sentencias crecen con los datos ({before} -> {after})'
+        if problem:
+            failures.append(f"{key[0]} {key[1]}: {problem}\n{large[key].report() or '  (sin sentencias repetidas)'}")
+    failures += [f'{route}: sin presupuesto en BUDGETS' for route in routes_without_budget(app)]
+
+    for failure in failures:
+        print(f'FALLO {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
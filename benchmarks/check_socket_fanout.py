@@ -0,0 +1,253 @@
+"""
+Checks that Socket.IO events reach clients connected to another gunicorn
+worker through the message queue (SOCKETIO_MESSAGE_QUEUE).
+
+Starts a Redis (redis-server when it is on the PATH, otherwise a fakeredis
+TCP server) and two gunicorn + eventlet servers, A and B, sharing it and a
+throwaway SQLite database. Over real HTTP and WebSocket connections:
+
+- a waiter on A creates orders and sends them to the kitchen (new_order is
+  emitted by A), and a cook on B starts and finishes them
+  (order_status_update is emitted by B);
+- a kitchen screen listens on B and a waiters screen on A, so every event
+  has to cross from one server to the other;
+- the kitchen screen then drops off, misses another round of orders and
+  comes back on A, sending `resync` with the last {epoch, seq} it saw. The
+  events it missed (kept in Redis) must be replayed, and nothing else.
+
+    python benchmarks/check_socket_fanout.py --orders 8
+
+It exits with status 1 when any event is missing, duplicated or out of
+sequence, or the replay is refused (`resync_required`). Needs
+`requests`, `websocket-client` and, without redis-server, `fakeredis`.
+"""
+import argparse
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _fixtures import use_database, ROOT
+use_database('fanout')
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+os.environ.setdefault('PDF_RENDER_WORKERS', '0')
+
+import json
+import logging
+import requests
+import socketio
+from _fixtures import PASSWORD, create_test_app, seed_users, seed_menu
+
+ORDER_URL = re.compile(r'/waiter/order/(\d+)$')
+DELIVERY_TIMEOUT = 15
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_redis():
+    """URL of a local Redis and a function that stops it."""
+    port = free_port()
+    if shutil.which('redis-server'):
+        process = subprocess.Popen(['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        stop = process.terminate
+        kind = 'redis-server'
+    else:
+        from fakeredis import TcpFakeServer
+        server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stop = server.shutdown
+        kind = 'fakeredis'
+    if not wait_for_port(port):
+        sys.exit(f"{kind} no respondió en el puerto {port}")
+    return f'redis://127.0.0.1:{port}/0', stop, kind
+
+
+def start_server(port, origins, log_path):
+    env = dict(os.environ, CORS_ALLOWED_ORIGINS=','.join(origins))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--worker-class', 'eventlet', '--workers', '1',
+                               '--bind', f'127.0.0.1:{port}', 'run:app'],
+                              cwd=ROOT, env=env, stdout=open(log_path, 'w'), stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f'{base_url}/login', timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            time.sleep(0.05)
+    server.terminate()
+    sys.exit(f"gunicorn no respondió en 30 segundos (ver {log_path})")
+
+
+def seed():
+    seed_users({'mesero': 'waiter', 'cocina': 'cook', 'pantalla_cocina': 'cook', 'pantalla_meseros': 'waiter'})
+    return seed_menu()['variants'][0]
+
+
+def login(base_url, username):
+    session = requests.Session()
+    response = session.post(f'{base_url}/login', data={'username': username, 'password': PASSWORD}, allow_redirects=False)
+    if response.status_code != 302:
+        sys.exit(f"No se pudo iniciar sesión como {username}")
+    return session
+
+
+class Screen:
+    """A Socket.IO client in its role's room that keeps every room event it receives."""
+
+    def __init__(self, base_url, username, resync=None):
+        self.events = []
+        self.lock = threading.Lock()
+        self.client = socketio.Client(reconnection=False, http_session=login(base_url, username))
+        for event in ('new_order', 'order_status_update', 'resync_required'):
+            self.client.on(event, lambda payload=None, event=event: self.received(event, payload))
+        if resync is not None:
+            # What main.js does on every (re)connect
+            self.client.on('connect', lambda: self.client.emit('resync', resync))
+        self.client.connect(base_url, transports=['websocket'])
+
+    def received(self, event, payload):
+        with self.lock:
+            self.events.append((event, payload))
+
+    def count(self, event):
+        with self.lock:
+            return len([e for e, _ in self.events if e == event])
+
+    def last_sync(self):
+        with self.lock:
+            payload = self.events[-1][1]
+        return {'epoch': payload['epoch'], 'seq': payload['seq']}
+
+
+def run_orders(url_a, url_b, product_id, count):
+    waiter = login(url_a, 'mesero')
+    cook = login(url_b, 'cocina')
+    item = json.dumps({'product_id': product_id, 'quantity': 1, 'extras': []})
+    order_ids = []
+    for _ in range(count):
+        response = waiter.post(f'{url_a}/waiter/create_order', data={'items': [item]}, allow_redirects=False)
+        match = ORDER_URL.search(response.headers.get('Location', ''))
+        if not match:
+            sys.exit(f"create_order respondió {response.status_code}")
+        order_id = int(match.group(1))
+        waiter.post(f'{url_a}/waiter/send_to_kitchen/{order_id}', allow_redirects=False)
+        order_ids.append(order_id)
+    for order_id in order_ids:
+        for action in ('start_preparation', 'mark_ready'):
+            response = cook.post(f'{url_b}/cook/{action}/{order_id}')
+            if response.status_code != 200:
+                sys.exit(f"{action} de la orden {order_id} respondió {response.status_code}")
+    return order_ids
+
+
+def wait_and_check(expected, first_seqs):
+    """
+    Waits for the screens in `expected` ({label: (screen, {event: count})})
+    and returns failure messages: missing or duplicated events, a sequence
+    that does not start at first_seqs[label] (when given) or has gaps or
+    reorderings, or a refused replay.
+    """
+    deadline = time.perf_counter() + DELIVERY_TIMEOUT
+    while time.perf_counter() < deadline and any(
+            screen.count(event) < n for screen, events in expected.values() for event, n in events.items()):
+        time.sleep(0.1)
+    # Room for duplicates to show up
+    time.sleep(0.5)
+
+    failures = []
+    for label, (screen, events) in expected.items():
+        for event, count in events.items():
+            received = screen.count(event)
+            print(f"{label:<28} {event:<20} {received}/{count}")
+            if received != count:
+                failures.append(f"{label}: {received} de {count} eventos {event}")
+        if screen.count('resync_required'):
+            failures.append(f"{label}: el servidor pidió recargar (resync_required) en lugar de reenviar")
+        # A room's events carry consecutive sequence numbers, whichever server emitted them
+        seqs = [payload['seq'] for event, payload in screen.events if event != 'resync_required']
+        first = first_seqs.get(label, seqs[0] if seqs else None)
+        if seqs != list(range(first, first + len(seqs))):
+            failures.append(f"{label}: secuencia {seqs}, se esperaba consecutiva desde {first}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    redis_url, stop_redis, redis_kind = start_redis()
+    os.environ['SOCKETIO_MESSAGE_QUEUE'] = redis_url
+    app = create_test_app()
+    with app.app_context():
+        product_id = seed()
+
+    port_a, port_b = free_port(), free_port()
+    url_a, url_b = f'http://127.0.0.1:{port_a}', f'http://127.0.0.1:{port_b}'
+    log_dir = tempfile.mkdtemp()
+    servers = [start_server(port, [url_a, url_b], os.path.join(log_dir, f'{name}.log'))
+               for name, port in (('a', port_a), ('b', port_b))]
+    print(f"{redis_kind} en {redis_url}; servidores A={url_a} B={url_b} (logs en {log_dir})")
+    screens = []
+    try:
+        kitchen = Screen(url_b, 'pantalla_cocina')
+        waiters = Screen(url_a, 'pantalla_meseros')
+        screens = [kitchen, waiters]
+        order_ids = run_orders(url_a, url_b, product_id, args.orders)
+
+        count = len(order_ids)
+        failures = wait_and_check({
+            'cocina en B': (kitchen, {'new_order': count, 'order_status_update': 2 * count}),
+            'meseros en A': (waiters, {'order_status_update': 2 * count}),
+        }, {})
+
+        # The kitchen screen misses a round of orders and comes back on the
+        # other server, which did not emit the new_order events it missed
+        last_sync = kitchen.last_sync()
+        kitchen.client.disconnect()
+        count = len(run_orders(url_a, url_b, product_id, args.orders))
+        returning = Screen(url_a, 'pantalla_cocina', resync=last_sync)
+        screens.append(returning)
+        failures += wait_and_check({
+            'cocina reconectada en A': (returning, {'new_order': count, 'order_status_update': 2 * count}),
+        }, {'cocina reconectada en A': last_sync['seq'] + 1})
+    finally:
+        for screen in screens:
+            screen.client.disconnect()
+        for server in servers:
+            server.terminate()
+            server.wait()
+        stop_redis()
+
+    if failures:
+        print('\n'.join(f"FALLO {failure}" for failure in failures))
+        sys.exit(1)
+    print("OK: los eventos llegan a los clientes del otro servidor y se reenvían al reconectarse")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Checks how fast a worker boots, so cold starts stay short.
+
+Two measurements, each in a fresh interpreter:
+
+- Import budget: `python -X importtime -c "import run"` (everything a
+  gunicorn worker loads before serving). Reports the total and the slowest
+  top-level imports, and fails if the total exceeds IMPORT_BUDGET_MS or a
+  module that should load lazily (LAZY_MODULES, e.g. ReportLab) is imported.
+- Time to first response: starts gunicorn with the eventlet worker, as the
+  Dockerfile does, and polls /login until it answers 200. Fails beyond
+  FIRST_RESPONSE_BUDGET_MS.
+
+    python benchmarks/check_startup.py
+
+It exits with status 1 on any failure, so it can run in CI. The schema is
+created beforehand with `init-db` (create_app no longer does it). Budgets
+can be overridden with the STARTUP_IMPORT_BUDGET_MS and
+STARTUP_FIRST_RESPONSE_BUDGET_MS environment variables.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = int(os.environ.get('STARTUP_IMPORT_BUDGET_MS', 2000))
+FIRST_RESPONSE_BUDGET_MS = int(os.environ.get('STARTUP_FIRST_RESPONSE_BUDGET_MS', 4000))
+# Only needed by some requests; importing them at boot delays every worker
+LAZY_MODULES = ('reportlab',)
+
+
+def bench_env():
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}")
+    env.setdefault('DEFAULT_ADMIN_PASSWORD', 'startup')
+    return env
+
+
+def import_times(env):
+    """{module: (self_ms, cumulative_ms, depth)} from -X importtime."""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import run'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000, depth)
+    return modules
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def first_response_ms(env):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/login'
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--worker-class', 'eventlet', '--workers', '1',
+                               '--bind', f'127.0.0.1:{port}', 'run:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < 30:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError('gunicorn no respondió en 30 segundos')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    env = bench_env()
+    # Schema and admin exist before the worker boots, as after a deploy
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'init-db'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    # Warm the bytecode cache so the first measurement does not compile
+    subprocess.run([sys.executable, '-c', 'import run'], cwd=ROOT, env=env, check=True)
+
+    failures = []
+    modules = import_times(env)
+    total = modules['run'][1]
+    print(f"import run: {total:.0f} ms (presupuesto {IMPORT_BUDGET_MS} ms)")
+    top_level = sorted(((cumulative, name) for name, (_, cumulative, depth) in modules.items() if depth == 1), reverse=True)
+    for cumulative, name in top_level[:10]:
+        print(f"  {cumulative:>8.1f} ms  {name}")
+    if total > IMPORT_BUDGET_MS:
+        failures.append(f"import run tarda {total:.0f} ms")
+    for lazy in LAZY_MODULES:
+        if any(name == lazy or name.startswith(lazy + '.') for name in modules):
+            failures.append(f"{lazy} se importa al arrancar")
+
+    elapsed = first_response_ms(env)
+    print(f"primera respuesta: {elapsed:.0f} ms (presupuesto {FIRST_RESPONSE_BUDGET_MS} ms)")
+    if elapsed > FIRST_RESPONSE_BUDGET_MS:
+        failures.append(f"la primera respuesta tarda {elapsed:.0f} ms")
+
+    for failure in failures:
+        print(f"FALLO: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
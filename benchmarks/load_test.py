@@ -0,0 +1,346 @@
+"""
+Rush-hour load test: waiters, cooks and live Socket.IO screens against a real
+gunicorn + eventlet server.
+
+Seeds a menu with variants, combos, drinks and extras, starts the app under
+gunicorn (as the Dockerfile does) and, over real HTTP and WebSocket
+connections:
+
+- N waiters each run take_order -> create_order -> send_to_kitchen for
+  their orders, and process_payment (GET + POST) as each one comes back
+  ready;
+- M cooks take sent orders as they arrive and run start_preparation and
+  mark_ready;
+- K Socket.IO clients sit in the kitchen and waiters rooms (half each),
+  only listening. Each new_order / order_status_update they receive is
+  timed from the start of the HTTP request that caused it.
+
+    python benchmarks/load_test.py --waiters 8 --cooks 2 --sockets 20 --orders 10
+
+It runs against a throwaway SQLite database by default. Set
+LOAD_TEST_DATABASE_URL to an EMPTY Postgres database to test the real
+setup (it creates tables and seeds rows). The order flow is random, but
+seeded (--seed), so two runs issue the same orders.
+
+The results are written to a JSON file (--output, default
+load_test.json): throughput, p50/p95/p99 per route, socket delivery
+latency and delivered/expected counts per event. The git commit is
+included. `--baseline old.json` prints the p95 change per route against an
+earlier run. Needs the `requests` and `websocket-client` packages (the
+python-socketio client uses them).
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from _fixtures import use_database, ROOT
+use_database('load', url_env='LOAD_TEST_DATABASE_URL')
+# Logins are not what is measured; keep them from dominating the setup
+os.environ.setdefault('PASSWORD_HASH_ITERATIONS', '1000')
+os.environ.setdefault('PDF_RENDER_WORKERS', '0')
+
+import requests
+import socketio
+from _fixtures import PASSWORD, create_test_app, seed_users, seed_menu
+from app import db
+
+ORDER_URL = re.compile(r'/waiter/order/(\d+)$')
+
+
+# --- Seed --- #
+
+def seed(waiters, cooks, screens):
+    """Users and a menu like the restaurant's; returns (sellable ids, extra ids)."""
+    users = {f'mesero{n}': 'waiter' for n in range(waiters)}
+    users.update({f'cocina{n}': 'cook' for n in range(cooks)})
+    # Screens alternate between the kitchen and waiters rooms
+    users.update({f'pantalla{n}': 'cook' if n % 2 == 0 else 'waiter' for n in range(screens)})
+    seed_users(users)
+    menu = seed_menu()
+    return menu['sellables'], menu['extras']
+
+
+def random_order(rng, sellables, extras):
+    items = []
+    for _ in range(rng.randint(1, 5)):
+        item = {'product_id': rng.choice(sellables), 'quantity': rng.randint(1, 3), 'extras': [], 'notes': ''}
+        if rng.random() < 0.3:
+            item['extras'] = [{'id': extra, 'quantity': 1} for extra in rng.sample(extras, rng.randint(1, 2))]
+        if rng.random() < 0.2:
+            item['notes'] = 'Sin cebolla'
+        items.append(item)
+    return items
+
+
+# --- Server --- #
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, log_path):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    log = open(log_path, 'w')
+    env = dict(os.environ, CORS_ALLOWED_ORIGINS=base_url)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--worker-class', 'eventlet', '--workers', str(workers),
+                               '--bind', f'127.0.0.1:{port}', 'run:app'],
+                              cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f'{base_url}/login', timeout=1).status_code == 200:
+                return server, base_url
+        except requests.RequestException:
+            time.sleep(0.05)
+    server.terminate()
+    sys.exit(f"gunicorn no respondió en 30 segundos (ver {log_path})")
+
+
+# --- Measurements --- #
+
+class Recorder:
+    """Latencies per route and per socket event, shared by every thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.errors = {}
+        self.triggers = {}
+        self.deliveries = {}
+
+    def request(self, session, method, route, url, expected, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, url, allow_redirects=False, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.routes.setdefault(route, []).append(elapsed)
+            if not expected(response):
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+    def trigger(self, event, order_id, status=None):
+        # Recorded before the request goes out, so no delivery can beat it
+        self.triggers[(event, order_id, status)] = time.perf_counter()
+
+    def delivered(self, event, payload):
+        arrived = time.perf_counter()
+        key = (event, payload.get('order_id'), payload.get('status'))
+        started = self.triggers.get(key)
+        if started is not None:
+            with self.lock:
+                self.deliveries.setdefault(event, []).append((arrived - started) * 1000)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+
+    def rank(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+    return {'count': len(samples), 'mean': round(sum(samples) / len(samples), 2),
+            'p50': rank(0.50), 'p95': rank(0.95), 'p99': rank(0.99), 'max': round(samples[-1], 2)}
+
+
+# --- Actors --- #
+
+def login(base_url, username):
+    session = requests.Session()
+    response = session.post(f'{base_url}/login', data={'username': username, 'password': PASSWORD}, allow_redirects=False)
+    if response.status_code != 302:
+        sys.exit(f"No se pudo iniciar sesión como {username}")
+    return session
+
+
+def redirect_to(path):
+    return lambda response: response.status_code == 302 and response.headers.get('Location', '').endswith(path)
+
+
+def status(code):
+    return lambda response: response.status_code == code
+
+
+def waiter(recorder, session, base_url, orders, rng, sellables, extras, kitchen, ready):
+    """Takes and sends its orders, paying each one as soon as it comes back ready."""
+    pending_payment = set()
+
+    def pay(order_id):
+        recorder.request(session, 'GET', 'GET /waiter/process_payment/<id>', f'{base_url}/waiter/process_payment/{order_id}', status(200))
+        recorder.request(session, 'POST', 'POST /waiter/process_payment/<id>', f'{base_url}/waiter/process_payment/{order_id}', status(200),
+                         data={'cash_received': '10000'})
+        pending_payment.discard(order_id)
+
+    for _ in range(orders):
+        recorder.request(session, 'GET', 'GET /waiter/take_order', f'{base_url}/waiter/take_order', status(200))
+        items = random_order(rng, sellables, extras)
+        response = recorder.request(session, 'POST', 'POST /waiter/create_order', f'{base_url}/waiter/create_order',
+                                    lambda r: r.status_code == 302 and ORDER_URL.search(r.headers.get('Location', '')),
+                                    data={'customer_name': 'Cliente', 'customer_phone': '', 'items': [json.dumps(i) for i in items]})
+        match = ORDER_URL.search(response.headers.get('Location', ''))
+        if not match:
+            continue
+        order_id = int(match.group(1))
+        recorder.trigger('new_order', order_id)
+        recorder.request(session, 'POST', 'POST /waiter/send_to_kitchen/<id>', f'{base_url}/waiter/send_to_kitchen/{order_id}',
+                         redirect_to('/waiter/dashboard'))
+        pending_payment.add(order_id)
+        kitchen.put((order_id, ready))
+        # Collect whatever the kitchen finished meanwhile
+        while True:
+            try:
+                pay(ready.get_nowait())
+            except queue.Empty:
+                break
+    while pending_payment:
+        pay(ready.get())
+
+
+def cook(recorder, session, base_url, kitchen):
+    while True:
+        job = kitchen.get()
+        if job is None:
+            return
+        order_id, ready = job
+        recorder.trigger('order_status_update', order_id, 'in_preparation')
+        recorder.request(session, 'POST', 'POST /cook/start_preparation/<id>', f'{base_url}/cook/start_preparation/{order_id}', status(200))
+        recorder.trigger('order_status_update', order_id, 'ready')
+        recorder.request(session, 'POST', 'POST /cook/mark_ready/<id>', f'{base_url}/cook/mark_ready/{order_id}', status(200))
+        ready.put(order_id)
+
+
+def screen(recorder, session, base_url):
+    client = socketio.Client(reconnection=False, http_session=session)
+    client.on('new_order', lambda payload: recorder.delivered('new_order', payload))
+    client.on('order_status_update', lambda payload: recorder.delivered('order_status_update', payload))
+    client.connect(base_url, transports=['websocket'])
+    return client
+
+
+# --- Run --- #
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    app = create_test_app()
+    with app.app_context():
+        sellables, extras = seed(args.waiters, args.cooks, args.sockets)
+        dialect = db.engine.dialect.name
+        db.engine.dispose()
+
+    log_path = os.path.join(tempfile.gettempdir(), 'load_test_gunicorn.log')
+    server, base_url = start_server(args.workers, log_path)
+    recorder = Recorder()
+    screens = []
+    try:
+        waiter_sessions = [login(base_url, f'mesero{n}') for n in range(args.waiters)]
+        cook_sessions = [login(base_url, f'cocina{n}') for n in range(args.cooks)]
+        screens = [screen(recorder, login(base_url, f'pantalla{n}'), base_url) for n in range(args.sockets)]
+        kitchen_screens = (args.sockets + 1) // 2
+        waiter_screens = args.sockets // 2
+
+        kitchen = queue.Queue()
+        cooks = [threading.Thread(target=cook, args=(recorder, session, base_url, kitchen)) for session in cook_sessions]
+        waiters = [threading.Thread(target=waiter, args=(recorder, session, base_url, args.orders, random.Random(args.seed + n),
+                                                         sellables, extras, kitchen, queue.Queue()))
+                   for n, session in enumerate(waiter_sessions)]
+        start = time.perf_counter()
+        for thread in cooks + waiters:
+            thread.start()
+        for thread in waiters:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        for _ in cooks:
+            kitchen.put(None)
+        for thread in cooks:
+            thread.join()
+        # Let the last socket events arrive
+        time.sleep(1)
+    finally:
+        for client in screens:
+            client.disconnect()
+        server.terminate()
+        server.wait()
+
+    orders = len([t for t in recorder.triggers if t[0] == 'new_order'])
+    request_count = sum(len(samples) for samples in recorder.routes.values())
+    expected = {
+        'new_order': orders * kitchen_screens,
+        # Both status updates go to both rooms
+        'order_status_update': orders * 2 * (kitchen_screens + waiter_screens),
+    }
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': dialect,
+        'config': {'waiters': args.waiters, 'cooks': args.cooks, 'sockets': args.sockets, 'orders_per_waiter': args.orders,
+                   'workers': args.workers, 'seed': args.seed},
+        'duration_s': round(elapsed, 3),
+        'throughput': {'orders_per_s': round(orders / elapsed, 2), 'requests_per_s': round(request_count / elapsed, 2)},
+        'routes': {route: dict(percentiles(samples), errors=recorder.errors.get(route, 0))
+                   for route, samples in sorted(recorder.routes.items())},
+        'sockets': {event: dict(percentiles(recorder.deliveries.get(event, [])), expected=expected[event])
+                    for event in expected},
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"{result['config']}  {result['database']}  {result['duration_s']} s")
+    print(f"{result['throughput']['orders_per_s']} órdenes/s, {result['throughput']['requests_per_s']} peticiones/s")
+    header = f"{'':<36} {'count':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print(header + ('  p95 vs base' if baseline else ''))
+    for route, stats in result['routes'].items():
+        line = f"{route:<36} {stats['count']:>6} {stats['errors']:>4} {stats['p50']:>8} {stats['p95']:>8} {stats['p99']:>8}"
+        base = (baseline or {}).get('routes', {}).get(route)
+        if base and base.get('p95'):
+            line += f"  {stats['p95'] / base['p95'] - 1:>+10.0%}"
+        print(line)
+    for event, stats in result['sockets'].items():
+        delivered = f"{stats['count']}/{stats['expected']}"
+        print(f"{'socket ' + event:<36} {delivered:>11} {stats.get('p50', '-'):>8} {stats.get('p95', '-'):>8} {stats.get('p99', '-'):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--waiters', type=int, default=8)
+    parser.add_argument('--cooks', type=int, default=2)
+    parser.add_argument('--sockets', type=int, default=20)
+    parser.add_argument('--orders', type=int, default=10, help='órdenes por mesero')
+    parser.add_argument('--workers', type=int, default=1, help='workers de gunicorn (más de 1 requiere SOCKETIO_MESSAGE_QUEUE)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='load_test.json')
+    parser.add_argument('--baseline', help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+
+    result = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    print(f"Resultados en {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,8 @@
+if __name__ == '__main__':
+    # Served by eventlet like the gunicorn workers, which patch before loading the app
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app, socketio
 
 app = create_app()